@@ -0,0 +1,101 @@
+"""
+Write-behind last-seen tracking for ghost users.
+
+Requests only touch Redis; `flush_activity` periodically copies the collected
+timestamps into Ghost Identity with one UPDATE per batch and drops them from
+Redis after the commit.
+"""
+
+import pickle
+from functools import partial
+
+import frappe
+from frappe.utils import create_batch, now_datetime
+
+from ghost.ghost_user import get_ghost_role
+
+LAST_SEEN_KEY = "ghost_last_seen"
+FLUSH_BATCH_SIZE = 500
+
+# ARGV: field, value pairs. Deletes each field still holding the flushed value.
+DROP_SCRIPT = """
+for i = 1, #ARGV, 2 do
+	if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+		redis.call('HDEL', KEYS[1], ARGV[i])
+	end
+end
+"""
+
+_drop_script = None
+
+
+def record_activity(response=None, request=None):
+	"""after_request hook: remember when a ghost was last seen. Never hits the database."""
+	session = getattr(frappe.local, "session", None)
+	user = session and session.user
+	if not user or user in ("Guest", "Administrator"):
+		return
+
+	settings = frappe.get_cached_doc("Ghost Settings")
+	if not settings.enable_ghost_feature or get_ghost_role(settings) not in frappe.get_roles(user):
+		return
+
+	frappe.cache().hset(LAST_SEEN_KEY, user, now_datetime())
+
+
+def flush_activity(run=None):
+	"""
+	Persist buffered last-seen timestamps. Returns the number of ghosts updated.
+	`run` is the `ghost.jobs.JobRun` of the calling scheduled job, if any.
+
+	The buffer is only trimmed once the UPDATEs commit, and only of the entries that
+	were written, so a failed or rolled back flush loses nothing and a ghost seen again
+	during the flush keeps its newer timestamp for the next one.
+	"""
+	cache = frappe.cache()
+
+	# Raw values, so the entries can be compared when they are dropped after the commit
+	pipe = cache.pipeline()
+	pipe.hgetall(cache.make_key(LAST_SEEN_KEY))
+	raw = pipe.execute()[0]
+	if not raw:
+		return 0
+
+	pending = [(user.decode(), pickle.loads(value)) for user, value in raw.items()]
+
+	for batch in create_batch(pending, FLUSH_BATCH_SIZE):
+		cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+		placeholders = ", ".join(["%s"] * len(batch))
+		values = [v for item in batch for v in item] + [user for user, _ in batch]
+		frappe.db.sql(
+			f"""
+			UPDATE `tabGhost Identity`
+			SET last_seen = CASE name {cases} ELSE last_seen END
+			WHERE name IN ({placeholders}) AND status = 'Active'
+		""",
+			values,
+		)
+		if run:
+			run.add_batch(len(batch))
+
+	frappe.db.after_commit.add(partial(_drop_flushed, raw))
+	return len(pending)
+
+
+def _drop_flushed(raw):
+	"""HDEL the flushed entries that were not overwritten by a newer hit in the meantime."""
+	key = frappe.cache().make_key(LAST_SEEN_KEY)
+	args = [item for pair in raw.items() for item in pair]
+	try:
+		for batch in create_batch(args, 2 * FLUSH_BATCH_SIZE):
+			_get_drop_script()(keys=[key], args=batch)
+	except Exception:
+		# Left in the buffer: the next flush writes the same timestamps again
+		frappe.logger().warning("Ghost activity: failed to trim the flushed entries", exc_info=True)
+
+
+def _get_drop_script():
+	global _drop_script
+	if _drop_script is None:
+		_drop_script = frappe.cache().register_script(DROP_SCRIPT)
+	return _drop_script
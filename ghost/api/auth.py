@@ -1,15 +1,31 @@
+from functools import partial
+
 import frappe
 from frappe import _
-from frappe.utils import random_string, now_datetime, add_to_date
+from frappe.utils import random_string, now_datetime, add_to_date, get_datetime
+from ghost.ghost.doctype.ghost_identity.ghost_identity import is_ghost as is_ghost_user
 from ghost.ghost.doctype.otp.otp import verify as ghost_verify_otp
+from ghost.ghost_user import get_user_role
+from ghost.metrics import instrument
+from ghost.oauth import get_client_policy, resolve_token_policy
+from ghost.phone import get_user_by_mobile, normalize_phone
+from ghost.replica import replica
+from ghost.tokens import INTROSPECTION_ROLE, cache_token, get_token_info, purge_tokens
+from ghost.tokens import revoke_tokens as revoke_bulk
+from ghost.tracing import set_attribute, span, traced
 
 @frappe.whitelist(allow_guest=True)
+@instrument("auth.login")
+@traced("auth.login")
 def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, client_id=None):
 	"""
 	Centralized Authentication API.
 	"""
+	# One settings snapshot (Redis-cached) shared by every step below
+	settings = frappe.get_cached_doc("Ghost Settings")
+
 	# Priority: 1. Backend Setting (Best Practice), 2. API Param (Override/Fallback)
-	backend_client_id = frappe.db.get_single_value("Ghost Settings", "client_id")
+	backend_client_id = settings.client_id
 	if backend_client_id:
 		client_id = backend_client_id
 
@@ -17,11 +33,21 @@ def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, clie
 	if not email and not mobile_no:
 		frappe.throw(_("Please provide either Email or Mobile Number"))
 
+	# Stored numbers are E.164, normalize so lookups (and the OTP match) are exact
+	if mobile_no:
+		mobile_no = normalize_phone(mobile_no, region=settings.default_phone_region)
+
+	# Token-only clients authenticate with the bearer tokens alone, so there must be a client to issue them
+	token_only = settings.token_only_login
+	if token_only and not client_id:
+		frappe.throw(_("Token-Only Login requires an OAuth Client ID"))
+
 	# 1. Identify Context (Ghost vs Guest)
 	current_user = frappe.session.user
-	is_ghost = current_user.startswith("ghost_")
+	is_ghost = is_ghost_user(current_user)
 	
 	user_to_login = None
+	tokens = None
 	
 	try:
 		if is_ghost:
@@ -42,6 +68,10 @@ def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, clie
 			
 			# If successful, the user is now the target email
 			user_to_login = target_email
+
+			# Conversion already issued tokens for the configured client; don't mint a second pair
+			if result.get("access_token") and client_id == settings.client_id:
+				tokens = {k: result[k] for k in ("access_token", "refresh_token", "expires_in", "token_type")}
 			
 		else:
 			# --- Scenario B: Direct Login / Signup ---
@@ -52,25 +82,31 @@ def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, clie
 			ghost_verify_otp(otp_code=otp, email=email, phone=mobile_no, purpose="Conversion")
 			
 			# 2. Find or Create User
-			if email:
-				user_to_login = frappe.db.get_value("User", {"email": email}, "name")
-				if not user_to_login:
-					# Create New User (Direct Signup)
-					user_to_login = create_new_user(email=email, first_name=first_name or email.split("@")[0], last_name=last_name)
-			elif mobile_no:
-				user_to_login = frappe.db.get_value("User", {"mobile_no": mobile_no}, "name")
-				if not user_to_login:
-					placeholder = f"{mobile_no}@mobile.login"
-					user_to_login = create_new_user(email=placeholder, mobile_no=mobile_no, first_name=first_name or mobile_no, last_name=last_name)
+			with span("auth.find_or_create_user"):
+				if email:
+					with replica():
+						user_to_login = frappe.db.get_value("User", {"email": email}, "name")
+					if not user_to_login:
+						# Create New User (Direct Signup)
+						user_to_login = create_new_user(email=email, first_name=first_name or email.split("@")[0], last_name=last_name, settings=settings)
+						set_attribute("created", True)
+				elif mobile_no:
+					# Not on the replica: misses fill a Redis cache that never expires
+					user_to_login = get_user_by_mobile(mobile_no)
+					if not user_to_login:
+						placeholder = f"{mobile_no}@mobile.login"
+						user_to_login = create_new_user(email=placeholder, mobile_no=mobile_no, first_name=first_name or mobile_no, last_name=last_name, settings=settings)
+						set_attribute("created", True)
 
 		# 3. Perform Login
 		if user_to_login:
 			# A. Session Login (Cookies)
-			# Only attempt if we have a request object (Web Context)
-			if getattr(frappe.local, "request", None):
+			# Only attempt if we have a request object (Web Context) and cookies are wanted
+			if not token_only and getattr(frappe.local, "request", None):
 				from frappe.auth import LoginManager
-				frappe.local.login_manager = LoginManager()
-				frappe.local.login_manager.login_as(user_to_login)
+				with span("auth.session_login"):
+					frappe.local.login_manager = LoginManager()
+					frappe.local.login_manager.login_as(user_to_login)
 			
 			response = {
 				"status": "success",
@@ -79,10 +115,10 @@ def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, clie
 			}
 
 			# B. OAuth Token (API Support)
-			if client_id:
-				tokens = generate_oauth_tokens(user_to_login, client_id)
-				if tokens:
-					response.update(tokens)
+			if client_id and not tokens:
+				tokens = generate_oauth_tokens(user_to_login, client_id, settings=settings)
+			if tokens:
+				response.update(tokens)
 			
 			return response
 			
@@ -94,12 +130,12 @@ def login(otp, email=None, mobile_no=None, first_name=None, last_name=None, clie
 		frappe.throw(_("Authentication Failed: ") + str(e))
 
 
-def create_new_user(email, mobile_no=None, first_name="Customer", last_name=None):
+def create_new_user(email, mobile_no=None, first_name="Customer", last_name=None, settings=None):
 	"""
 	Helper to create a new user with the default role from settings.
 	"""
-	settings = frappe.get_single("Ghost Settings")
-	default_role = settings.default_user_role or "Customer"
+	settings = settings or frappe.get_cached_doc("Ghost Settings")
+	default_role = get_user_role(settings)
 
 	user = frappe.new_doc("User")
 	user.email = email
@@ -117,12 +153,15 @@ def create_new_user(email, mobile_no=None, first_name="Customer", last_name=None
 	user.insert(ignore_permissions=True)
 	return user.name
 
-def generate_oauth_tokens(user, client_id=None):
+@traced("auth.issue_tokens")
+def generate_oauth_tokens(user, client_id=None, commit=True, settings=None):
 	"""
 	Creates OAuth Bearer Tokens with configurable expiration from Ghost Settings.
 	Returns access_token, refresh_token, expires_in, and token_type.
+	Pass commit=False when the caller owns the transaction (e.g. conversion),
+	and the caller's settings snapshot to avoid loading it again.
 	"""
-	settings = frappe.get_single("Ghost Settings")
+	settings = settings or frappe.get_cached_doc("Ghost Settings")
 	
 	# Use client_id from settings if not provided
 	if not client_id:
@@ -131,14 +170,14 @@ def generate_oauth_tokens(user, client_id=None):
 	if not client_id:
 		frappe.throw(_("OAuth Client ID is not configured in Ghost Settings"))
 	
-	# Verify client exists
-	if not frappe.db.exists("OAuth Client", client_id):
+	# Verify client exists (served from the per-worker client cache)
+	if not is_valid_client(client_id):
 		frappe.throw(_("OAuth Client {0} does not exist").format(client_id))
 	
-	# Get token configuration from settings
-	access_expiry_seconds = int(settings.access_token_expiry_seconds or 3600)  # Default: 1 hour
-	refresh_expiry_days = int(settings.refresh_token_expiry_days or 30)  # Default: 30 days
-	scopes = settings.ghost_token_scope or "all"
+	# Token configuration: the client's own policy, falling back to Ghost Settings
+	policy = resolve_token_policy(client_id, settings)
+	access_expiry_seconds = policy.access_expiry_seconds
+	scopes = policy.scopes
 	
 	# Create OAuth Bearer Token
 	bearer_token = frappe.new_doc("OAuth Bearer Token")
@@ -156,8 +195,23 @@ def generate_oauth_tokens(user, client_id=None):
 	# Store refresh token expiration in a custom field or calculate on refresh
 	# For now, we'll handle expiration in the refresh endpoint
 	
+	# Client checked above and the user is ours, skip re-validating the links
+	bearer_token.flags.ignore_links = True
 	bearer_token.insert(ignore_permissions=True)
-	frappe.db.commit()
+
+	# Only cache the token once it is committed, a rolled back conversion must not leave it valid
+	frappe.db.after_commit.add(
+		partial(
+			cache_token,
+			bearer_token.access_token,
+			user,
+			scopes,
+			bearer_token.expiration_time,
+			client=client_id,
+		)
+	)
+	if commit:
+		frappe.db.commit()
 	
 	frappe.logger().info(f"Generated OAuth tokens for user: {user}")
 	
@@ -168,7 +222,16 @@ def generate_oauth_tokens(user, client_id=None):
 		"token_type": "Bearer"
 	}
 
+def is_valid_client(client_id):
+	"""
+	OAuth Client existence, from the per-worker cache in `ghost.oauth`
+	(invalidated by the OAuth Client doc events).
+	"""
+	return get_client_policy(client_id) is not None
+
 @frappe.whitelist(allow_guest=True)
+@instrument("refresh_bearer_token")
+@traced("refresh_bearer_token")
 def refresh_bearer_token(refresh_token):
 	"""
 	Refreshes an expired access token using a valid refresh token.
@@ -181,7 +244,7 @@ def refresh_bearer_token(refresh_token):
 	token_name = frappe.db.get_value(
 		"OAuth Bearer Token",
 		{"refresh_token": refresh_token, "status": "Active"},
-		["name", "user", "client", "creation"],
+		["name", "user", "client", "creation", "access_token"],
 		as_dict=True
 	)
 	
@@ -189,22 +252,24 @@ def refresh_bearer_token(refresh_token):
 		frappe.throw(_("Invalid or expired refresh token"), frappe.AuthenticationError)
 	
 	# Check if refresh token has expired (based on creation date + expiry days)
-	settings = frappe.get_single("Ghost Settings")
-	refresh_expiry_days = int(settings.refresh_token_expiry_days or 30)
+	settings = frappe.get_cached_doc("Ghost Settings")
+	refresh_expiry_days = resolve_token_policy(token_name.client, settings).refresh_expiry_days
 	
 	token_age = now_datetime() - token_name.creation
 	if token_age.days > refresh_expiry_days:
 		# Invalidate the old token
 		frappe.db.set_value("OAuth Bearer Token", token_name.name, "status", "Revoked")
 		frappe.db.commit()
+		purge_tokens([token_name.access_token])
 		frappe.throw(_("Refresh token has expired. Please login again."), frappe.AuthenticationError)
 	
 	# Revoke the old token
 	frappe.db.set_value("OAuth Bearer Token", token_name.name, "status", "Revoked")
 	frappe.db.commit()
+	purge_tokens([token_name.access_token])
 	
 	# Generate new tokens for the same user and client
-	new_tokens = generate_oauth_tokens(token_name.user, token_name.client)
+	new_tokens = generate_oauth_tokens(token_name.user, token_name.client, settings=settings)
 	
 	frappe.logger().info(f"Refreshed OAuth tokens for user: {token_name.user}")
 	
@@ -213,3 +278,40 @@ def refresh_bearer_token(refresh_token):
 		"message": "Token refreshed successfully",
 		**new_tokens
 	}
+
+
+@frappe.whitelist()
+def introspect_token(token):
+	"""
+	Token introspection (RFC 7662 style) for gateways and services in front of the site,
+	served from the Ghost token cache. Callers need the Ghost Token Introspector role.
+	"""
+	frappe.only_for(INTROSPECTION_ROLE)
+
+	info = get_token_info(token)
+	if not info:
+		return {"active": False}
+
+	return {
+		"active": True,
+		"username": info["user"],
+		"scope": info["scopes"],
+		"client_id": info["client"],
+		"exp": int(get_datetime(info["expiration_time"]).timestamp()),
+	}
+
+
+@frappe.whitelist(methods=["POST"])
+def revoke_tokens(client=None, scope=None, users=None, issued_after=None, issued_before=None):
+	"""
+	Bulk revocation for incidents: every active token matching all the given filters.
+	`users` is a list (or JSON list) of user ids. Returns the revoked counts.
+	"""
+	frappe.only_for("System Manager")
+
+	if isinstance(users, str):
+		users = frappe.parse_json(users) if users.startswith("[") else [users]
+
+	return revoke_bulk(
+		client=client, scope=scope, users=users, issued_after=issued_after, issued_before=issued_before
+	)
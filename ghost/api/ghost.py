@@ -1,84 +1,154 @@
+import uuid
+
 import frappe
 from frappe import _
-from frappe.utils import random_string, get_url
-import uuid
+from frappe.utils import add_to_date, cint, get_url, now_datetime, random_string
+
+from ghost import funnel
+from ghost.api.auth import create_new_user, generate_oauth_tokens
+from ghost.conversion import convert_identity, enqueue_merge, finalize_real_user, get_merge_progress
+from ghost.ghost.doctype.ghost_identity.ghost_identity import (
+	device_digest,
+	find_ghost_by_device,
+	is_ghost,
+	mark_converted,
+	mark_converting,
+	register,
+	remember_device,
+)
+from ghost.ghost_user import get_ghost_role, insert_ghost_user, materialize_user
+from ghost.locks import redis_lock, single_flight
+from ghost.metrics import instrument
+from ghost.oauth import resolve_session_client
+from ghost.rate_limiter import token_bucket
+from ghost.replica import replica
+from ghost.tokens import purge_tokens
+from ghost.tracing import set_attribute, span, traced
+
+TOKEN_RESPONSE_KEYS = ("access_token", "refresh_token", "expires_in", "token_type")
 
-import frappe.rate_limiter
 
 @frappe.whitelist(allow_guest=True)
-@frappe.rate_limiter.rate_limit(limit=100, seconds=3600)
-def create_ghost_session(email=None):
+@instrument("create_ghost_session")
+@token_bucket("create_ghost_session")
+@traced("create_ghost_session")
+def create_ghost_session(email=None, client_id=None, device_key=None):
 	"""
 	Creates a Ghost User and returns their API Key/Secret + Session details.
+	Tokens are issued for `client_id` when it is listed in Ghost Settings > Session Clients,
+	otherwise for the Ghost Settings client.
+	With a `device_key` (e.g. an install ID), repeat calls within the Device Key Window
+	return the same ghost with fresh tokens instead of creating another one.
 	"""
-	settings = frappe.get_single('Ghost Settings')
+	with replica():
+		settings = frappe.get_single('Ghost Settings')
 	if not settings.enable_ghost_feature:
 		frappe.throw("Ghost feature is disabled.")
 
-	ghost_role = settings.ghost_role or "Guest"
+	client_id = resolve_session_client(client_id, settings)
+
+	if not device_key:
+		return _create_ghost_session(settings, email, client_id)
+
+	digest = device_digest(device_key)
+	window_hours = cint(settings.device_key_window_hours)
+
+	# Serialize calls per device so concurrent retries cannot create two ghosts
+	with redis_lock(f"ghost_device:{digest}", timeout=30, blocking_timeout=10) as acquired:
+		if not acquired:
+			frappe.throw(_("A session for this device is already being created."), frappe.DocumentLockedError)
+
+		if window_hours:
+			ghost_user = find_ghost_by_device(digest, window_hours)
+			set_attribute("resumed", bool(ghost_user))
+			if ghost_user:
+				tokens = _issue_ghost_tokens(ghost_user, client_id)
+				return _ghost_session_response(ghost_user, tokens, "Ghost session resumed")
+
+		response = _create_ghost_session(settings, email, client_id, device_key=digest)
+		if window_hours:
+			remember_device(digest, response["user"], add_to_date(now_datetime(), hours=window_hours))
+		return response
+
+def _create_ghost_session(settings, email=None, client_id=None, device_key=None):
+	ghost_role = get_ghost_role(settings)
 	domain = settings.ghost_email_domain or "guest.local"
 
-	# Generate Email
-	if not email:
+	if email:
+		# A caller-chosen address must stay in the ghost domain and never adopt an existing
+		# User: this endpoint is open to guests, so that would hand out tokens for someone else
+		email = email.strip().lower()
+		if email.rpartition("@")[2] != domain.lower():
+			frappe.throw(_("Ghost emails must use the {0} domain.").format(domain))
+		if frappe.db.exists("User", email):
+			frappe.throw(_("User {0} already exists.").format(email), frappe.DuplicateEntryError)
+	else:
 		unique_id = str(uuid.uuid4())[:8]
 		email = f"ghost_{unique_id}@{domain}"
-	else:
-		# If email provided, ensure it's not taken, or return existing ghost?
-		# For safety, we enforce generated emails for now unless specified.
-		pass
-
-	if frappe.db.exists("User", email):
-		# Re-use? Or error? For now, assume new session needed.
-		pass
-
-	# Create User
-	user = frappe.new_doc("User")
-	user.email = email
-	user.first_name = "Ghost"
-	user.last_name = "User"
-	user.send_welcome_email = 0
-	user.roles = []
-	
-	try:
-		user.save(ignore_permissions=True)
-	except frappe.DuplicateEntryError:
-		user = frappe.get_doc("User", email)
 
-	# Assign Role
-	if ghost_role not in [r.role for r in user.roles]:
-		user.add_roles(ghost_role)
-		user.save(ignore_permissions=True)
+	with span("ghost.create_user"):
+		# Lean insert: the User controller only runs if the ghost becomes a real account
+		try:
+			user = insert_ghost_user(email, ghost_role)
+		except frappe.DuplicateEntryError:
+			# Created concurrently: same rule as above
+			frappe.throw(_("User {0} already exists.").format(email), frappe.DuplicateEntryError)
 
-	# Generate OAuth Bearer Tokens instead of API keys
-	from ghost.api.auth import generate_oauth_tokens
-	
+		register(user.name, device_key=device_key)
+		funnel.count("session_created")
+
+	# Generate OAuth Bearer Tokens instead of API keys (commits the new ghost)
+	tokens = _issue_ghost_tokens(user.name, client_id)
+	return _ghost_session_response(email, tokens, "Ghost session created")
+
+def _issue_ghost_tokens(user, client_id=None):
 	try:
-		tokens = generate_oauth_tokens(user.name)
+		return generate_oauth_tokens(user, client_id=client_id)
 	except Exception as e:
-		frappe.log_error(f"Failed to generate tokens for ghost user {user.name}: {str(e)}")
+		frappe.log_error(f"Failed to generate tokens for ghost user {user}: {str(e)}")
 		frappe.throw(_("Failed to generate authentication tokens. Please check Ghost Settings."))
-	
+
+def _ghost_session_response(user, tokens, message):
 	return {
-		"user": email,
+		"user": user,
 		"access_token": tokens["access_token"],
 		"refresh_token": tokens["refresh_token"],
 		"expires_in": tokens["expires_in"],
 		"token_type": tokens["token_type"],
-		"message": "Ghost session created"
+		"message": message
 	}
 
 @frappe.whitelist()
+@instrument("convert_to_real_user")
+@traced("convert_to_real_user")
 def convert_to_real_user(ghost_email, real_email, first_name=None, last_name=None, otp_code=None):
 	"""
 	Converts a Ghost User to a Real User.
 	- If Real User exists: Merges Ghost data into Real User.
 	- If Real User does not exist: Renames Ghost User to Real User.
+
+	Conversions of the same ghost are serialized by a per-ghost lock. Retries of an
+	in-flight or just-finished conversion (same caller and target) get its result without
+	the tokens: those are only returned to the call that passed the OTP check.
 	"""
+	return single_flight(
+		f"conversion:{ghost_email}",
+		lambda: _convert_to_real_user(ghost_email, real_email, first_name, last_name, otp_code),
+		result_key=f"conversion:{ghost_email}:{real_email}:{frappe.session.user}",
+		shared_result=_without_tokens,
+	)
+
+
+def _without_tokens(response):
+	return {k: v for k, v in response.items() if k not in TOKEN_RESPONSE_KEYS}
+
+
+def _convert_to_real_user(ghost_email, real_email, first_name=None, last_name=None, otp_code=None):
 	from ghost.ghost.doctype.otp.otp import verify as verify_otp
 
-	settings = frappe.get_single("Ghost Settings")
+	settings = frappe.get_cached_doc("Ghost Settings")
 
-	if not frappe.db.exists("User", ghost_email):
+	if not is_ghost(ghost_email):
 		frappe.throw(_("Ghost user {} does not exist").format(ghost_email))
 
 	# Optional: Verify OTP before conversion if enabled
@@ -92,73 +162,82 @@ def convert_to_real_user(ghost_email, real_email, first_name=None, last_name=Non
 
 	# Check if target exists
 	target_exists = frappe.db.exists("User", real_email)
+	# Rename mode turns the ghost User itself into the new account
+	renamed_ghost = not target_exists and not settings.async_conversion and settings.conversion_mode != "Targeted"
 
-	# 1. Rename / Merge
-	original_user = frappe.session.user
-	frappe.set_user("Administrator")
+	# Everything below runs in one transaction with a single commit at the end,
+	# so a failure never leaves a half-converted user behind.
 	try:
-		# If target exists, merge=True. If not, merge=False (rename).
-		frappe.rename_doc("User", ghost_email, real_email, force=True, merge=bool(target_exists))
-	finally:
-		frappe.set_user(original_user)
-
-	# 2. Update Role & Profile (of the resulting user)
-	# Reload to be safe after rename
-	user = frappe.get_doc("User", real_email)
-	
-	# Transition Logic
-	ghost_role = settings.ghost_role or "Ghost"
-	target_role = settings.default_user_role or "Website User"
+		# 1. Invalidate old ghost user tokens if configured.
+		# Done before the rename: rename_doc re-points OAuth Bearer Token.user to the real user.
+		if settings.invalidate_ghost_tokens_on_conversion:
+			with span("conversion.revoke_tokens"):
+				ghost_tokens = frappe.get_all(
+					"OAuth Bearer Token", filters={"user": ghost_email, "status": "Active"}, pluck="access_token"
+				)
+				frappe.db.sql("""
+					UPDATE `tabOAuth Bearer Token`
+					SET status = 'Revoked'
+					WHERE user = %s AND status = 'Active'
+				""", (ghost_email,))
+				purge_tokens(ghost_tokens)
+				set_attribute("revoked", len(ghost_tokens))
+			frappe.logger().info(f"Invalidated ghost tokens for {ghost_email}")
 
-	# Filter out Ghost Role
-	new_roles = [r for r in user.roles if r.role != ghost_role]
-	
-	# Add Target Role if not present
-	existing_role_names = [r.role for r in new_roles]
-	if target_role and target_role not in existing_role_names:
-		new_roles.append({"doctype": "Has Role", "role": target_role})
-	
-	# Fallback safety (ensure at least one role)
-	if not new_roles:
-		new_roles.append({"doctype": "Has Role", "role": "Website User"})
+		# 2. Rename / Merge (full rename_doc or targeted link rewrite, per Conversion Mode)
+		with span(
+			"conversion.merge",
+			mode="Async" if settings.async_conversion else settings.conversion_mode,
+			target_exists=bool(target_exists),
+		):
+			if settings.async_conversion:
+				# The real account must exist before its tokens can be issued; the ghost's data follows later
+				if not target_exists:
+					create_new_user(
+						email=real_email, first_name=first_name or real_email.split("@")[0], last_name=last_name
+					)
+				mark_converting(ghost_email, real_email)
+			else:
+				convert_identity(
+					ghost_email, real_email, target_exists, settings, first_name=first_name, last_name=last_name
+				)
+				mark_converted(ghost_email, real_email)
 
-	user.set("roles", new_roles)
+		# 3. Update Role & Profile (of the resulting user) as row-level edits
+		with span("conversion.finalize"):
+			finalize_real_user(real_email, settings, first_name=first_name, last_name=last_name)
+			if renamed_ghost:
+				# The lean ghost User is now the real account: run the User controller once
+				materialize_user(real_email)
 
-	# Update Details
-	if first_name:
-		user.first_name = first_name
-	if last_name:
-		user.last_name = last_name
-	
-	user.save(ignore_permissions=True)
-	frappe.db.commit()
+		# 4. Generate new tokens for the converted/merged real user
+		try:
+			new_tokens = generate_oauth_tokens(real_email, commit=False)
+		except Exception as e:
+			frappe.log_error(f"Failed to generate tokens for converted user {real_email}: {str(e)}")
+			# Don't fail the conversion if token generation fails, just log it
+			new_tokens = None
 
-	# 3. Token Management: Invalidate ghost tokens and generate new tokens for real user
-	from ghost.api.auth import generate_oauth_tokens
-	
-	# Invalidate old ghost user tokens if configured
-	if settings.invalidate_ghost_tokens_on_conversion:
-		frappe.db.sql("""
-			UPDATE `tabOAuth Bearer Token`
-			SET status = 'Revoked'
-			WHERE user = %s AND status = 'Active'
-		""", (ghost_email,))
-		frappe.db.commit()
-		frappe.logger().info(f"Invalidated ghost tokens for {ghost_email}")
-	
-	# Generate new tokens for the converted/merged real user
-	try:
-		new_tokens = generate_oauth_tokens(real_email)
-	except Exception as e:
-		frappe.log_error(f"Failed to generate tokens for converted user {real_email}: {str(e)}")
-		# Don't fail the conversion if token generation fails, just log it
-		new_tokens = None
+		if settings.async_conversion:
+			# Picked up by the queue once the commit below lands
+			enqueue_merge(ghost_email, real_email)
+
+		funnel.count("merged" if target_exists else "converted")
+	except Exception:
+		frappe.db.rollback()
+		raise
+
+	frappe.db.commit()
 
 	response = {
 		"message": _("User converted/merged successfully"),
 		"user": real_email,
 		"merged": target_exists
 	}
+
+	if settings.async_conversion:
+		response["message"] = _("User converted successfully. Ghost data is being merged in the background.")
+		response["merge_status"] = "Queued"
 	
 	# Add new tokens to response if generated successfully
 	if new_tokens:
@@ -170,3 +249,33 @@ def convert_to_real_user(ghost_email, real_email, first_name=None, last_name=Non
 		})
 	
 	return response
+
+
+@frappe.whitelist()
+def get_conversion_status(ghost_email):
+	"""
+	Poll the progress of a conversion (Async Conversion merges ghost data in the background).
+	Available to the converted user and System Managers.
+	"""
+	identity = frappe.db.get_value(
+		"Ghost Identity", ghost_email, ["status", "converted_to", "converted_on"], as_dict=True
+	)
+	if not identity:
+		frappe.throw(_("Ghost user {} does not exist").format(ghost_email), frappe.DoesNotExistError)
+
+	if frappe.session.user not in (ghost_email, identity.converted_to) and "System Manager" not in frappe.get_roles():
+		frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+	progress = get_merge_progress(ghost_email)
+
+	return {
+		"ghost": ghost_email,
+		"user": identity.converted_to,
+		"status": identity.status,
+		"converted_on": identity.converted_on,
+		"merge_status": progress.get("state") or ("Completed" if identity.status == "Converted" else None),
+		"rows_moved": progress.get("rows_moved"),
+		"columns_done": progress.get("columns_done"),
+		"columns_total": progress.get("columns_total"),
+		"error": progress.get("error"),
+	}
@@ -0,0 +1,50 @@
+import frappe
+from frappe import _
+from werkzeug.wrappers import Response
+
+from ghost.metrics import render_prometheus
+from ghost.profiler import get_profile
+from ghost.profiler import get_profiles as list_profiles
+
+
+# API: GET /api/method/ghost.api.metrics.prometheus
+@frappe.whitelist(methods=["GET"])
+def prometheus():
+	"""
+	Ghost endpoint and job metrics in Prometheus text format, aggregated across workers.
+	Restricted to System Manager (scrape with an API key of such a user).
+	"""
+	frappe.only_for("System Manager")
+	return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@frappe.whitelist(methods=["GET"])
+def get_profiles():
+	"""Slowest sampled calls kept by the Ghost profiler, slowest first."""
+	frappe.only_for("System Manager")
+	return list_profiles()
+
+
+@frappe.whitelist(methods=["GET"])
+def download_profile(profile_id, fmt="pstats"):
+	"""
+	A kept profile as a file: `pstats` (cProfile output for snakeviz / flameprof)
+	or `sql` (the statements of the call and their timings, as JSON).
+	"""
+	frappe.only_for("System Manager")
+
+	profile = get_profile(profile_id)
+	if not profile:
+		raise frappe.DoesNotExistError(_("Profile {0} not found or expired").format(profile_id))
+
+	filename = f"ghost-{profile['name']}-{profile_id}"
+	if fmt == "sql":
+		body = frappe.as_json({k: v for k, v in profile.items() if k != "pstats"})
+		response = Response(body, mimetype="application/json")
+		filename += ".json"
+	else:
+		response = Response(profile["pstats"], mimetype="application/octet-stream")
+		filename += ".pstats"
+
+	response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+	return response
@@ -3,10 +3,14 @@ from frappe import _
 
 from ghost.ghost.doctype.otp.otp import generate as generate_otp
 from ghost.ghost.doctype.otp.otp import verify as verify_otp
+from ghost.metrics import instrument
+from ghost.phone import normalize_phone
+from ghost.sender import get_captured_otp as read_captured_otp
 
 
 # API: POST /api/method/ghost.api.send_otp
 @frappe.whitelist(allow_guest=True, methods=["POST"])
+@instrument("otp.send_otp")
 def send_otp(email=None, phone=None, purpose=None, user=None):
 	"""
 	Send OTP API endpoint
@@ -48,6 +52,7 @@ def send_otp(email=None, phone=None, purpose=None, user=None):
 
 # API: POST /api/method/ghost.api.validate_otp
 @frappe.whitelist(allow_guest=True, methods=["POST"])
+@instrument("otp.validate_otp")
 def validate_otp(otp_code, email=None, phone=None, purpose=None):
 	"""
 	Verify OTP API endpoint
@@ -94,3 +99,26 @@ def validate_otp(otp_code, email=None, phone=None, purpose=None):
 		frappe.local.response["message"] = _("OTP verification failed")
 		frappe.local.response["error"] = str(e)
 		return
+
+
+# API: GET /api/method/ghost.api.otp.get_captured_otp
+@frappe.whitelist(methods=["GET"])
+def get_captured_otp(email=None, phone=None):
+	"""
+	Last OTP recorded for a recipient while Capture Mode is on, for test harnesses
+
+	Args:
+	    email: Email address the OTP was generated for
+	    phone: Phone number the OTP was generated for
+
+	Returns:
+	    otp_code, delivery_method and captured_at, or None if nothing was captured
+	"""
+	frappe.only_for("System Manager")
+
+	if not frappe.db.get_single_value("Ghost Settings", "otp_capture_mode"):
+		frappe.throw(_("Capture Mode is not enabled in Ghost Settings"))
+
+	if phone:
+		phone = normalize_phone(phone)
+	return read_captured_otp(email or phone)
@@ -0,0 +1,74 @@
+"""
+Benchmarks for Ghost flows. They write real data, run them on a test site only:
+
+    bench --site test_site execute ghost.benchmarks.login.run --kwargs "{'iterations': 50}"
+    bench --site test_site ghost-benchmark --save        # record ghost/benchmarks/baseline.json
+    bench --site test_site ghost-benchmark --compare     # fail on regressions against it
+"""
+
+import time
+from contextlib import contextmanager
+
+import frappe
+
+from ghost.metrics import count_queries
+
+
+@contextmanager
+def count_commits():
+	"""Count frappe.db.commit calls inside the block."""
+	counter = {"commits": 0}
+	db = frappe.local.db
+	original_commit = db.commit
+
+	def _commit(*args, **kwargs):
+		counter["commits"] += 1
+		return original_commit(*args, **kwargs)
+
+	db.commit = _commit
+	try:
+		yield counter
+	finally:
+		db.commit = original_commit
+
+
+def measure(fn):
+	"""Run `fn` once; return (latency in ms, SQL statement count, commit count)."""
+	with count_commits() as commits, count_queries() as counter:
+		start = time.perf_counter()
+		fn()
+		elapsed = (time.perf_counter() - start) * 1000
+	return elapsed, counter["queries"], commits["commits"]
+
+
+def percentile(values, pct):
+	if not values:
+		return None
+	ordered = sorted(values)
+	index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+	return ordered[index]
+
+
+def summarize(samples):
+	"""samples: list of (latency_ms, queries, commits) -> summary dict"""
+	latencies = [s[0] for s in samples]
+	queries = [s[1] for s in samples]
+	commits = [s[2] for s in samples]
+	return {
+		"runs": len(samples),
+		"p50_ms": round(percentile(latencies, 50), 2),
+		"p95_ms": round(percentile(latencies, 95), 2),
+		"queries_avg": round(sum(queries) / len(queries), 1),
+		"queries_max": max(queries),
+		"commits_max": max(commits),
+	}
+
+
+def print_report(title, results):
+	print(f"\n{title}")
+	print(f"{'scenario':<26}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}{'max':>6}{'commits':>9}")
+	for name, r in results.items():
+		print(
+			f"{name:<26}{r['runs']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['queries_avg']:>10}"
+			f"{r['queries_max']:>6}{r['commits_max']:>9}"
+		)
@@ -0,0 +1,171 @@
+"""
+Concurrent replay of the Ghost funnel from many simulated clients:
+
+    create ghost -> send OTP -> login (converts the ghost) -> refresh token
+
+Every client is a thread with its own site connection. OTPs are delivered to an
+in-process sink instead of the real email/SMS providers, and the report gives
+throughput, error rate and latency percentiles per step. It writes real data,
+run it on a local or test site only:
+
+    bench --site test_site ghost-loadtest --clients 20 --iterations 10
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+import frappe
+
+from ghost.api.auth import login, refresh_bearer_token
+from ghost.api.ghost import create_ghost_session
+from ghost.api.otp import send_otp
+from ghost.benchmarks import percentile
+
+STEPS = ("create_ghost_session", "send_otp", "login", "refresh_bearer_token")
+FLOWS = ("convert", "login")
+
+
+class OTPSink:
+	"""Captures OTPs in memory, keyed by recipient, instead of sending them."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._codes = {}
+		self.delivered = 0
+
+	def record(self, otp_code, delivery_method, email=None, phone=None):
+		with self._lock:
+			self._codes[email or phone] = otp_code
+			self.delivered += 1
+
+	def pop(self, recipient):
+		with self._lock:
+			return self._codes.pop(recipient, None)
+
+
+class StepStats:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.latencies = defaultdict(list)
+		self.errors = defaultdict(lambda: defaultdict(int))
+
+	def add(self, step, ms, error=None):
+		with self._lock:
+			self.latencies[step].append(ms)
+			if error:
+				self.errors[step][error] += 1
+
+	def report(self, wall_seconds):
+		report = {}
+		for step in STEPS:
+			latencies = self.latencies.get(step)
+			if not latencies:
+				continue
+			errors = sum(self.errors[step].values())
+			report[step] = {
+				"requests": len(latencies),
+				"errors": errors,
+				"error_rate": round(errors / len(latencies), 4),
+				"throughput_rps": round(len(latencies) / wall_seconds, 2),
+				"p50_ms": round(percentile(latencies, 50), 2),
+				"p95_ms": round(percentile(latencies, 95), 2),
+				"p99_ms": round(percentile(latencies, 99), 2),
+				"error_types": dict(self.errors[step]),
+			}
+		return report
+
+
+class StepFailed(Exception):
+	pass
+
+
+def run(site, clients=10, iterations=5, flow="convert", sites_path=None):
+	"""Run `clients` concurrent clients, each walking the funnel `iterations` times."""
+	if flow not in FLOWS:
+		frappe.throw(f"Unknown flow {flow}, expected one of {', '.join(FLOWS)}")
+
+	sink = OTPSink()
+	stats = StepStats()
+	sites_path = sites_path or getattr(frappe.local, "sites_path", ".")
+
+	threads = [
+		threading.Thread(target=_client, args=(site, sites_path, sink, stats, int(iterations), flow))
+		for _ in range(int(clients))
+	]
+	start = time.perf_counter()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	wall = time.perf_counter() - start
+
+	report = stats.report(wall)
+	print_report(report, clients, iterations, flow, wall, sink.delivered)
+	return report
+
+
+def _client(site, sites_path, sink, stats, iterations, flow):
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+	try:
+		frappe.flags.ghost_otp_sink = sink
+		for _ in range(iterations):
+			try:
+				_walk_funnel(sink, stats, flow)
+			except StepFailed:
+				# Already counted, the next iteration starts a fresh funnel
+				pass
+	finally:
+		frappe.destroy()
+
+
+def _walk_funnel(sink, stats, flow):
+	email = f"loadtest_{frappe.generate_hash(length=10)}@example.com"
+
+	frappe.set_user("Guest")
+	if flow == "convert":
+		# The rest of the funnel runs as the ghost, so login converts it into the real user
+		ghost = _step(stats, "create_ghost_session", create_ghost_session)["user"]
+		frappe.set_user(ghost)
+
+	_step(stats, "send_otp", lambda: send_otp(email=email, purpose="Conversion"))
+	otp = sink.pop(email)
+	tokens = _step(stats, "login", lambda: login(otp=otp, email=email))
+
+	frappe.set_user("Guest")
+	_step(stats, "refresh_bearer_token", lambda: refresh_bearer_token(tokens["refresh_token"]))
+
+
+def _step(stats, name, fn):
+	frappe.local.response = frappe._dict()
+	start = time.perf_counter()
+	try:
+		result = fn()
+		# Some endpoints report failures through the response instead of raising
+		status = frappe.local.response.get("http_status_code")
+		if status and int(status) >= 400:
+			raise frappe.ValidationError(frappe.local.response.get("message"))
+		frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		stats.add(name, (time.perf_counter() - start) * 1000, error=type(e).__name__)
+		raise StepFailed from e
+
+	stats.add(name, (time.perf_counter() - start) * 1000)
+	return result
+
+
+def print_report(report, clients, iterations, flow, wall, delivered):
+	print(f"\nGhost load test: {clients} clients x {iterations} iterations, flow={flow}, {wall:.1f}s")
+	print(f"OTPs captured by the sink: {delivered}")
+	print(
+		f"{'step':<24}{'requests':>10}{'errors':>8}{'err %':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+	)
+	for step, r in report.items():
+		print(
+			f"{step:<24}{r['requests']:>10}{r['errors']:>8}{r['error_rate'] * 100:>8.1f}{r['throughput_rps']:>9}"
+			f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+		)
+		for error, count in r["error_types"].items():
+			print(f"    {error}: {count}")
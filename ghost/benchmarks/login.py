@@ -0,0 +1,62 @@
+"""
+Queries and latency of `ghost.api.auth.login` per scenario:
+ghost conversion, existing email, new email and mobile number.
+"""
+
+import secrets
+
+import frappe
+
+from ghost.api.auth import create_new_user, login
+from ghost.api.ghost import create_ghost_session
+from ghost.benchmarks import measure, print_report, summarize
+from ghost.ghost.doctype.otp.otp import generate as generate_otp
+
+SCENARIOS = ("ghost_conversion", "existing_email", "new_email", "mobile")
+
+
+def run(iterations=20, scenarios=SCENARIOS):
+	frappe.set_user("Administrator")
+	results = {}
+	for scenario in scenarios:
+		samples = [_run_once(scenario, i) for i in range(int(iterations))]
+		results[scenario] = summarize(samples)
+
+	frappe.set_user("Administrator")
+	print_report("ghost.api.auth.login", results)
+	return results
+
+
+def _run_once(scenario, i):
+	key = frappe.generate_hash(length=8)
+	email = mobile_no = None
+
+	if scenario == "ghost_conversion":
+		frappe.set_user("Administrator")
+		ghost = create_ghost_session()["user"]
+		email = f"bench_conv_{key}@example.com"
+		otp = _otp(email=email)
+		frappe.set_user(ghost)
+	elif scenario == "existing_email":
+		frappe.set_user("Administrator")
+		email = f"bench_existing_{key}@example.com"
+		create_new_user(email=email, first_name="Bench")
+		otp = _otp(email=email)
+		frappe.set_user("Guest")
+	elif scenario == "new_email":
+		email = f"bench_new_{key}@example.com"
+		otp = _otp(email=email)
+		frappe.set_user("Guest")
+	else:
+		mobile_no = "+1555" + "".join(str(secrets.randbelow(10)) for _ in range(7))
+		otp = _otp(email=f"{mobile_no}@mobile.login", phone=mobile_no)
+		frappe.set_user("Guest")
+
+	frappe.db.commit()
+	sample = measure(lambda: login(otp=otp, email=email, mobile_no=mobile_no))
+	frappe.db.commit()
+	return sample
+
+
+def _otp(email=None, phone=None):
+	return generate_otp(email=email, phone=phone, purpose="Conversion", send=False)["otp_code"]
@@ -0,0 +1,133 @@
+"""
+Latency, SQL statement and commit baselines for the Ghost endpoints.
+
+Each flow prepares its inputs outside the measurement, then times a single call.
+`run(save=True)` writes the results to a JSON baseline; `compare` re-runs the
+flows and raises `BenchmarkRegression` when one got slower than the threshold
+or issues more queries or commits than the baseline.
+"""
+
+import json
+import os
+
+import frappe
+
+from ghost.api.auth import generate_oauth_tokens, login, refresh_bearer_token
+from ghost.api.ghost import convert_to_real_user, create_ghost_session
+from ghost.benchmarks import measure, print_report, summarize
+from ghost.ghost.doctype.otp.otp import generate as generate_otp
+from ghost.ghost.doctype.otp.otp import verify as verify_otp
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+LATENCY_THRESHOLD = 0.25
+
+
+class BenchmarkRegression(Exception):
+	pass
+
+
+def _create_ghost_session():
+	frappe.set_user("Guest")
+	return create_ghost_session
+
+
+def _login():
+	email = f"bench_login_{frappe.generate_hash(length=8)}@example.com"
+	otp = _otp(email)
+	frappe.set_user("Guest")
+	return lambda: login(otp=otp, email=email)
+
+
+def _refresh_bearer_token():
+	refresh_token = generate_oauth_tokens("Administrator")["refresh_token"]
+	frappe.set_user("Guest")
+	return lambda: refresh_bearer_token(refresh_token)
+
+
+def _otp_generate():
+	email = f"bench_otp_{frappe.generate_hash(length=8)}@example.com"
+	return lambda: generate_otp(email=email, purpose="Login", send=False)
+
+
+def _otp_verify():
+	email = f"bench_otp_{frappe.generate_hash(length=8)}@example.com"
+	otp = _otp(email, purpose="Login")
+	return lambda: verify_otp(otp, email=email, purpose="Login")
+
+
+def _convert_to_real_user():
+	ghost = create_ghost_session()["user"]
+	real = f"bench_real_{frappe.generate_hash(length=8)}@example.com"
+	otp = _otp(real)
+	frappe.set_user(ghost)
+	return lambda: convert_to_real_user(ghost, real, otp_code=otp)
+
+
+FLOWS = {
+	"create_ghost_session": _create_ghost_session,
+	"auth.login": _login,
+	"refresh_bearer_token": _refresh_bearer_token,
+	"otp.generate": _otp_generate,
+	"otp.verify": _otp_verify,
+	"convert_to_real_user": _convert_to_real_user,
+}
+
+
+def run(iterations=20, flows=None, save=False, baseline_path=BASELINE_PATH):
+	results = {}
+	for name in flows or FLOWS:
+		samples = []
+		for _ in range(int(iterations)):
+			frappe.set_user("Administrator")
+			fn = FLOWS[name]()
+			frappe.db.commit()
+			samples.append(measure(fn))
+			frappe.db.commit()
+		results[name] = summarize(samples)
+
+	frappe.set_user("Administrator")
+	print_report("Ghost endpoints", results)
+
+	if save:
+		with open(baseline_path, "w") as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+		print(f"\nBaseline written to {baseline_path}")
+	return results
+
+
+def compare(iterations=20, flows=None, threshold=LATENCY_THRESHOLD, baseline_path=BASELINE_PATH):
+	"""Re-run the flows against the saved baseline. Returns the regressions, raising if there are any."""
+	with open(baseline_path) as f:
+		baseline = json.load(f)
+
+	results = run(iterations=iterations, flows=flows or list(baseline))
+	regressions = find_regressions(baseline, results, float(threshold))
+
+	if regressions:
+		print("\nRegressions:")
+		for line in regressions:
+			print(f"  {line}")
+		raise BenchmarkRegression("\n".join(regressions))
+
+	print("\nNo regressions against the baseline.")
+	return regressions
+
+
+def find_regressions(baseline, results, threshold=LATENCY_THRESHOLD):
+	"""Latency may drift by `threshold`; query and commit counts are deterministic and must not grow."""
+	regressions = []
+	for name, current in results.items():
+		base = baseline.get(name)
+		if not base:
+			continue
+		if current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+			regressions.append(f"{name}: p95 {current['p95_ms']} ms vs {base['p95_ms']} ms")
+		if current["queries_max"] > base["queries_max"]:
+			regressions.append(f"{name}: {current['queries_max']} queries vs {base['queries_max']}")
+		if current["commits_max"] > base.get("commits_max", current["commits_max"]):
+			regressions.append(f"{name}: {current['commits_max']} commits vs {base['commits_max']}")
+	return regressions
+
+
+def _otp(email, purpose="Conversion"):
+	return generate_otp(email=email, purpose=purpose, send=False)["otp_code"]
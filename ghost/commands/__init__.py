@@ -0,0 +1,97 @@
+import sys
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("revoke-ghost-tokens")
+@click.option("--client", help="OAuth Client name")
+@click.option("--scope", help="Revoke tokens carrying this scope")
+@click.option("--user", "users", multiple=True, help="User id, repeat for several users")
+@click.option("--issued-after", help="Only tokens issued at or after this datetime")
+@click.option("--issued-before", help="Only tokens issued before this datetime")
+@click.option("--chunk-size", type=int, default=1000, show_default=True)
+@pass_context
+def revoke_ghost_tokens(context, client, scope, users, issued_after, issued_before, chunk_size):
+	"Revoke active OAuth bearer tokens matching all the given filters"
+	import frappe
+
+	from ghost.tokens import revoke_tokens
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		result = revoke_tokens(
+			client=client,
+			scope=scope,
+			users=list(users),
+			issued_after=issued_after,
+			issued_before=issued_before,
+			chunk_size=chunk_size,
+		)
+	finally:
+		frappe.destroy()
+
+	click.echo(f"Revoked {result['revoked']} tokens in {result['chunks']} chunks")
+	for client_name, count in sorted(result["clients"].items()):
+		click.echo(f"  {client_name}: {count}")
+
+
+
+@click.command("ghost-benchmark")
+@click.option("--iterations", type=int, default=20, show_default=True)
+@click.option("--flow", "flows", multiple=True, help="Flow to run, repeat for several (default: all)")
+@click.option("--save", is_flag=True, help="Write the results as the new baseline")
+@click.option("--compare", is_flag=True, help="Fail if a flow regressed against the baseline")
+@click.option("--threshold", type=float, default=0.25, show_default=True, help="Allowed p95 latency growth")
+@pass_context
+def ghost_benchmark(context, iterations, flows, save, compare, threshold):
+	"Benchmark the Ghost endpoints (writes data, use a test site)"
+	import frappe
+
+	from ghost.benchmarks import suite
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		if compare:
+			suite.compare(iterations=iterations, flows=list(flows), threshold=threshold)
+		else:
+			suite.run(iterations=iterations, flows=list(flows), save=save)
+	except suite.BenchmarkRegression:
+		sys.exit(1)
+	finally:
+		frappe.destroy()
+
+
+
+@click.command("ghost-loadtest")
+@click.option("--clients", type=int, default=10, show_default=True, help="Concurrent simulated clients")
+@click.option("--iterations", type=int, default=5, show_default=True, help="Funnel runs per client")
+@click.option(
+	"--flow",
+	type=click.Choice(["convert", "login"]),
+	default="convert",
+	show_default=True,
+	help="convert: ghost -> OTP -> login -> refresh, login: OTP -> direct login -> refresh",
+)
+@pass_context
+def ghost_loadtest(context, clients, iterations, flow):
+	"Replay the Ghost funnel concurrently with OTPs captured in-process (writes data, use a test site)"
+	import frappe
+
+	from ghost.benchmarks import loadtest
+
+	site = get_site(context)
+	frappe.init(site=site)
+	try:
+		sites_path = frappe.local.sites_path
+	finally:
+		frappe.destroy()
+
+	loadtest.run(site, clients=clients, iterations=iterations, flow=flow, sites_path=sites_path)
+
+
+commands = [revoke_ghost_tokens, ghost_benchmark, ghost_loadtest]
@@ -0,0 +1,276 @@
+"""
+Ghost -> real user data migration.
+
+Two modes, picked by Ghost Settings > Conversion Mode:
+
+- Rename: `frappe.rename_doc` on the User. Safe for any site, but walks every
+  Link / Dynamic Link to User in every installed doctype.
+- Targeted: rewrites only the User links of the doctypes listed in
+  Ghost Settings > Conversion DocTypes with one set-based UPDATE per column,
+  using a link map that is computed once and cached in Redis.
+
+With Async Conversion enabled the data move runs in a background job
+(`merge_ghost_job`) and its progress is kept in Redis for polling. Only the
+Targeted mode merges in committed chunks; in Rename mode the job is a single
+`rename_doc(merge=True)` in one transaction. A failed merge is retried up to
+MERGE_ATTEMPTS times, after which the Ghost Identity is marked Merge Failed.
+"""
+
+import frappe
+
+from ghost.ghost.doctype.ghost_identity.ghost_identity import mark_converted, mark_merge_failed
+from ghost.ghost_user import get_ghost_role, get_user_role
+
+LINK_MAP_CACHE_KEY = "ghost_conversion_link_map"
+PROGRESS_CACHE_KEY = "ghost_conversion_progress"
+PROGRESS_TTL = 24 * 60 * 60
+MERGE_CHUNK_SIZE = 500
+MERGE_ATTEMPTS = 3
+
+# Rows that belong to the ghost identity itself and must never follow it to the real account.
+EXCLUDED_DOCTYPES = {
+	"User",
+	"Has Role",
+	"Ghost Identity",
+	"OAuth Bearer Token",
+	"OAuth Authorization Code",
+	"Sessions",
+}
+
+
+def convert_identity(ghost_email, real_email, target_exists, settings, first_name=None, last_name=None):
+	"""Move the ghost's data to `real_email` and remove the ghost User."""
+	if settings.conversion_mode == "Targeted":
+		targeted_convert(ghost_email, real_email, target_exists, first_name=first_name, last_name=last_name)
+	else:
+		rename_convert(ghost_email, real_email, target_exists)
+
+
+def rename_convert(ghost_email, real_email, target_exists):
+	original_user = frappe.session.user
+	frappe.set_user("Administrator")
+	try:
+		# If target exists, merge=True. If not, merge=False (rename).
+		frappe.rename_doc("User", ghost_email, real_email, force=True, merge=bool(target_exists))
+	finally:
+		frappe.set_user(original_user)
+
+
+def targeted_convert(ghost_email, real_email, target_exists, first_name=None, last_name=None):
+	from ghost.api.auth import create_new_user
+
+	if not target_exists:
+		# The real account goes through the full User controller; the ghost is then merged into it.
+		create_new_user(
+			email=real_email, first_name=first_name or real_email.split("@")[0], last_name=last_name
+		)
+
+	rewrite_links(ghost_email, real_email)
+	frappe.delete_doc("User", ghost_email, ignore_permissions=True, force=1)
+
+
+def finalize_real_user(real_email, settings, first_name=None, last_name=None):
+	"""
+	Swap the ghost role for the target role and update the profile of the resulting user.
+	Works on the Has Role rows and User columns directly instead of reloading and
+	re-saving the whole User document.
+	"""
+	ghost_role = get_ghost_role(settings)
+	target_role = get_user_role(settings)
+
+	roles = frappe.get_all("Has Role", filters={"parent": real_email, "parenttype": "User"}, pluck="role")
+
+	# Filter out Ghost Role
+	if ghost_role in roles:
+		frappe.db.delete("Has Role", {"parent": real_email, "parenttype": "User", "role": ghost_role})
+		roles = [r for r in roles if r != ghost_role]
+
+	# Add Target Role if not present
+	if target_role and target_role not in roles:
+		frappe.get_doc(
+			{
+				"doctype": "Has Role",
+				"parent": real_email,
+				"parenttype": "User",
+				"parentfield": "roles",
+				"role": target_role,
+				"idx": len(roles) + 1,
+			}
+		).db_insert()
+		roles.append(target_role)
+
+	user = frappe.db.get_value(
+		"User", real_email, ["first_name", "middle_name", "last_name", "user_type"], as_dict=True
+	)
+	values = {}
+	if first_name:
+		values["first_name"] = user.first_name = first_name
+	if last_name:
+		values["last_name"] = user.last_name = last_name
+	if values:
+		values["full_name"] = " ".join(filter(None, [user.first_name, user.middle_name, user.last_name]))
+
+	# Mirror User.set_system_user for the standard user types
+	if user.user_type in ("System User", "Website User"):
+		has_desk_access = frappe.db.exists("Role", {"name": ["in", roles], "desk_access": 1})
+		user_type = "System User" if has_desk_access else "Website User"
+		if user_type != user.user_type:
+			values["user_type"] = user_type
+
+	if values:
+		frappe.db.set_value("User", real_email, values)
+
+	frappe.clear_cache(user=real_email)
+
+
+def rewrite_links(ghost_email, real_email):
+	"""Point every mapped User link from the ghost to the real user. Returns rows updated."""
+	updated = 0
+	for table, field, condition in iter_link_columns():
+		count = frappe.db.sql(
+			f"SELECT COUNT(*) FROM `{table}` WHERE `{field}` = %s {condition}", (ghost_email,)
+		)[0][0]
+		if not count:
+			continue
+
+		frappe.db.sql(
+			f"UPDATE `{table}` SET `{field}` = %s WHERE `{field}` = %s {condition}", (real_email, ghost_email)
+		)
+		updated += count
+	return updated
+
+
+def rewrite_links_chunked(ghost_email, real_email, chunk_size=MERGE_CHUNK_SIZE):
+	"""
+	Same as `rewrite_links`, but commits every `chunk_size` rows so a large ghost
+	history never holds row locks for long. Used by the background merge.
+	"""
+	columns = list(iter_link_columns())
+	moved = 0
+	for i, (table, field, condition) in enumerate(columns):
+		while True:
+			names = frappe.db.sql_list(
+				f"SELECT name FROM `{table}` WHERE `{field}` = %s {condition} LIMIT {int(chunk_size)}",
+				(ghost_email,),
+			)
+			if not names:
+				break
+			frappe.db.sql(f"UPDATE `{table}` SET `{field}` = %s WHERE name IN %s", (real_email, tuple(names)))
+			frappe.db.commit()
+			moved += len(names)
+
+		set_merge_progress(
+			ghost_email, state="Running", rows_moved=moved, columns_done=i + 1, columns_total=len(columns)
+		)
+	return moved
+
+
+def iter_link_columns():
+	"""(table, column, extra condition) for every column in the link map"""
+	for entry in get_link_map():
+		table = f"tab{entry['doctype']}"
+		for field in entry["fields"]:
+			yield table, field, ""
+		for field, doctype_field in entry["dynamic_fields"]:
+			yield table, field, f"AND `{doctype_field}` = 'User'"
+
+
+def enqueue_merge(ghost_email, real_email, attempt=1):
+	set_merge_progress(ghost_email, state="Queued", attempt=attempt)
+	frappe.enqueue(
+		"ghost.conversion.merge_ghost_job",
+		queue="long",
+		# Per attempt: a retry is enqueued while the failed job still holds its id
+		job_id=f"ghost_conversion::{ghost_email}::{attempt}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		ghost_email=ghost_email,
+		real_email=real_email,
+		attempt=attempt,
+	)
+
+
+def merge_ghost_job(ghost_email, real_email, attempt=1):
+	"""
+	Background half of an async conversion: the real user and its tokens already exist.
+	Rename mode merges with one unchunked rename_doc; Targeted mode commits every MERGE_CHUNK_SIZE rows.
+	"""
+	settings = frappe.get_cached_doc("Ghost Settings")
+	set_merge_progress(ghost_email, state="Running")
+
+	try:
+		if settings.conversion_mode == "Targeted":
+			rows_moved = rewrite_links_chunked(ghost_email, real_email)
+			frappe.delete_doc("User", ghost_email, ignore_permissions=True, force=1)
+		else:
+			rows_moved = None
+			rename_convert(ghost_email, real_email, target_exists=True)
+
+		mark_converted(ghost_email, real_email)
+		frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title="Ghost Conversion", message=frappe.get_traceback())
+
+		if attempt < MERGE_ATTEMPTS:
+			set_merge_progress(ghost_email, error=str(e))
+			enqueue_merge(ghost_email, real_email, attempt=attempt + 1)
+		else:
+			# Never leave the ghost Converting forever: surface it for a manual look
+			mark_merge_failed(ghost_email)
+			set_merge_progress(ghost_email, state="Failed", error=str(e))
+		frappe.db.commit()
+		raise
+
+	set_merge_progress(ghost_email, state="Completed", rows_moved=rows_moved, error="")
+
+
+def set_merge_progress(ghost_email, **progress):
+	key = f"{PROGRESS_CACHE_KEY}:{ghost_email}"
+	current = frappe.cache().get_value(key, expires=True) or {}
+	current.update({k: v for k, v in progress.items() if v is not None})
+	frappe.cache().set_value(key, current, expires_in_sec=PROGRESS_TTL)
+
+
+def get_merge_progress(ghost_email):
+	return frappe.cache().get_value(f"{PROGRESS_CACHE_KEY}:{ghost_email}", expires=True) or {}
+
+
+def get_link_map():
+	return frappe.cache().get_value(LINK_MAP_CACHE_KEY, generator=build_link_map)
+
+
+def clear_link_map():
+	frappe.cache().delete_value(LINK_MAP_CACHE_KEY)
+
+
+def build_link_map():
+	"""
+	Columns holding a User in the allow-listed doctypes and their child tables:
+	owner, modified_by, Link fields to User and Dynamic Links that can point to User.
+	"""
+	settings = frappe.get_cached_doc("Ghost Settings")
+	link_map = {}
+
+	for doctype in get_conversion_doctypes(settings):
+		if doctype in EXCLUDED_DOCTYPES or not frappe.db.exists("DocType", doctype):
+			continue
+
+		meta = frappe.get_meta(doctype)
+		metas = [meta] + [frappe.get_meta(df.options) for df in meta.get_table_fields()]
+
+		for m in metas:
+			if m.issingle or m.is_virtual or m.name in EXCLUDED_DOCTYPES or m.name in link_map:
+				continue
+			link_map[m.name] = {
+				"doctype": m.name,
+				"fields": ["owner", "modified_by"]
+				+ [df.fieldname for df in m.get_link_fields() if df.options == "User"],
+				"dynamic_fields": [(df.fieldname, df.options) for df in m.get_dynamic_link_fields()],
+			}
+
+	return list(link_map.values())
+
+
+def get_conversion_doctypes(settings):
+	return [d.strip() for d in (settings.conversion_doctypes or "").splitlines() if d.strip()]
@@ -0,0 +1,88 @@
+"""
+Ghost funnel counters: sessions created, OTPs sent, conversions, merges and expiries.
+
+Each event bumps a per-day Redis hash once its transaction commits, so analytics
+never scan tabUser. `flush_funnel` copies the running totals of today and
+yesterday into Ghost Funnel Daily; totals (not increments) are written, so a
+flush can run any number of times. A stored count is never lowered: if the Redis
+hash was lost (restart, eviction) the rebuilt totals start from zero, so each
+field keeps the greater of the stored and the Redis value.
+"""
+
+from functools import partial
+
+import frappe
+from frappe.utils import add_days, getdate, now_datetime, today
+
+FUNNEL_KEY = "ghost_funnel"
+# Long enough for yesterday's counters to be flushed after midnight
+FUNNEL_TTL = 3 * 24 * 60 * 60
+
+# Event -> Ghost Funnel Daily field
+EVENTS = {
+	"session_created": "sessions_created",
+	"otp_sent": "otps_sent",
+	"converted": "conversions",
+	"merged": "merges",
+	"expired": "expired",
+}
+
+
+def count(event, n=1):
+	"""Count `event` when the current transaction commits (nothing on rollback)."""
+	if event not in EVENTS:
+		raise ValueError(f"Unknown funnel event: {event}")
+	if n:
+		frappe.db.after_commit.add(partial(_increment, event, n, today()))
+
+
+def _increment(event, n, date):
+	"""Counting must never break the flow it observes."""
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{FUNNEL_KEY}:{date}")
+		pipe = cache.pipeline()
+		pipe.hincrby(key, event, n)
+		pipe.expire(key, FUNNEL_TTL)
+		pipe.execute()
+	except Exception:
+		frappe.logger().warning(f"Ghost funnel: failed to count {event}", exc_info=True)
+
+
+def get_counts(date):
+	"""{field: total} for one day, straight from Redis."""
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	pipe.hgetall(cache.make_key(f"{FUNNEL_KEY}:{getdate(date)}"))
+	raw = pipe.execute()[0]
+	counts = {k.decode(): int(v) for k, v in raw.items()}
+	return {field: counts.get(event, 0) for event, field in EVENTS.items()}
+
+
+def flush_funnel(run=None):
+	"""Persist today's and yesterday's totals. Returns the number of days written."""
+	days = 0
+	for date in (add_days(today(), -1), today()):
+		counts = get_counts(date)
+		if not any(counts.values()):
+			continue
+
+		name = frappe.db.get_value("Ghost Funnel Daily", {"date": date})
+		if name:
+			assignments = ", ".join(
+				f"`{field}` = GREATEST(COALESCE(`{field}`, 0), %({field})s)" for field in counts
+			)
+			frappe.db.sql(
+				f"UPDATE `tabGhost Funnel Daily` SET {assignments}, modified = %(modified)s WHERE name = %(name)s",
+				{**counts, "modified": now_datetime(), "name": name},
+			)
+		else:
+			frappe.get_doc({"doctype": "Ghost Funnel Daily", "date": date, **counts}).insert(
+				ignore_permissions=True
+			)
+		frappe.db.commit()
+		days += 1
+		if run:
+			run.add_batch(1)
+
+	return days
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Muneeb Mohammed and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Ghost Funnel Daily", {
+// 	refresh: function(frm) {
+
+// 	},
+// });
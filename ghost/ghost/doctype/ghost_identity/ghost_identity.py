@@ -0,0 +1,125 @@
+# Copyright (c) 2026, Muneeb Mohammed and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+DEVICE_CACHE_KEY = "ghost_device"
+
+
+class GhostIdentity(Document):
+	pass
+
+
+def on_doctype_update():
+	# Cleanup scans Active ghosts by age, activity expiry scans them by last_seen.
+	frappe.db.add_index("Ghost Identity", ["status", "created"])
+	frappe.db.add_index("Ghost Identity", ["status", "last_seen"])
+
+
+def register(user, device_key=None):
+	"""Record a freshly created ghost user in the registry. `device_key` is the digest from `device_digest`."""
+	now = now_datetime()
+	frappe.get_doc(
+		{
+			"doctype": "Ghost Identity",
+			"user": user,
+			"status": "Active",
+			"created": now,
+			"last_seen": now,
+			"device_key": device_key,
+		}
+	).insert(ignore_permissions=True)
+
+
+def device_digest(device_key):
+	"""Client device keys are only stored hashed."""
+	return hashlib.sha256(device_key.encode()).hexdigest()
+
+
+def find_ghost_by_device(digest, window_hours):
+	"""
+	Active ghost created for this device within the window, looked up in Redis first.
+	A cached ghost is re-checked by primary key so a converted or expired one is never resumed.
+	"""
+	key = f"{DEVICE_CACHE_KEY}:{digest}"
+	user = frappe.cache().get_value(key, expires=True)
+	if user:
+		if is_ghost(user):
+			return user
+		frappe.cache().delete_value(key)
+		return None
+
+	ghost = frappe.db.get_value(
+		"Ghost Identity",
+		{
+			"device_key": digest,
+			"status": "Active",
+			"created": [">=", add_to_date(now_datetime(), hours=-window_hours)],
+		},
+		["name", "created"],
+		as_dict=True,
+		order_by="created desc",
+	)
+	if not ghost:
+		return None
+
+	remember_device(digest, ghost.name, add_to_date(ghost.created, hours=window_hours))
+	return ghost.name
+
+
+def remember_device(digest, user, until):
+	ttl = int((get_datetime(until) - now_datetime()).total_seconds())
+	if ttl > 0:
+		frappe.cache().set_value(f"{DEVICE_CACHE_KEY}:{digest}", user, expires_in_sec=ttl)
+
+
+def is_ghost(user):
+	"""Primary-key lookup replacing the old `startswith("ghost_")` heuristic."""
+	if not user or user in ("Guest", "Administrator"):
+		return False
+	return frappe.db.get_value("Ghost Identity", user, "status") == "Active"
+
+
+def mark_converted(ghost_user, real_user):
+	frappe.db.set_value(
+		"Ghost Identity",
+		ghost_user,
+		{"status": "Converted", "converted_to": real_user, "converted_on": now_datetime()},
+		update_modified=False,
+	)
+
+
+def mark_converting(ghost_user, real_user):
+	"""Async conversion: the real account is live, the ghost's data is still being merged."""
+	frappe.db.set_value(
+		"Ghost Identity",
+		ghost_user,
+		{"status": "Converting", "converted_to": real_user},
+		update_modified=False,
+	)
+
+
+def mark_merge_failed(ghost_user):
+	"""Async conversion whose background merge ran out of attempts."""
+	frappe.db.set_value("Ghost Identity", ghost_user, "status", "Merge Failed", update_modified=False)
+
+
+def mark_expired(ghost_user):
+	frappe.db.set_value("Ghost Identity", ghost_user, "status", "Expired", update_modified=False)
+
+
+def get_inactive_ghosts(last_seen_before, names=None):
+	"""Active ghosts not seen since the given datetime (served by the status/last_seen index)."""
+	filters = {"status": "Active", "last_seen": ["<", last_seen_before]}
+	if names is not None:
+		filters["name"] = ["in", names]
+	return frappe.get_all(
+		"Ghost Identity",
+		filters=filters,
+		pluck="name",
+		order_by="last_seen asc",
+	)
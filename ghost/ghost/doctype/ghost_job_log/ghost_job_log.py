@@ -0,0 +1,16 @@
+# Copyright (c) 2026, Muneeb Mohammed and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class GhostJobLog(Document):
+	@staticmethod
+	def clear_old_logs(days=30):
+		"""Called by Frappe's log clearing (see default_log_clearing_doctypes in hooks)"""
+		from frappe.query_builder import Interval
+		from frappe.query_builder.functions import Now
+
+		table = frappe.qb.DocType("Ghost Job Log")
+		frappe.db.delete(table, filters=(table.creation < (Now() - Interval(days=days))))
@@ -19,9 +19,78 @@ class GhostSettings(Document):
 		if self.refresh_token_expiry_days and self.refresh_token_expiry_days < 1:
 			frappe.throw(_("Refresh Token Expiry should be at least 1 day."))
 
+		if self.token_only_login and not self.client_id:
+			frappe.throw(_("OAuth Client ID is required when Token-Only Login is enabled."))
+
 		# Sandbox mode validation
 		if getattr(self, "sandbox_mode", 0) and not getattr(self, "sandbox_otp", None):
 			frappe.throw(_("Sandbox OTP Code is required when Sandbox Mode is enabled."))
+
+		# Sandbox short-circuits before anything Capture Mode is meant to exercise
+		if self.sandbox_mode and self.otp_capture_mode:
+			frappe.throw(_("Sandbox Mode and Capture Mode cannot be enabled together."))
+
+		if self.profile_sample_rate and not 0 <= self.profile_sample_rate <= 1:
+			frappe.throw(_("Profile Sample Rate must be between 0 and 1."))
+
+		if self.use_read_replica and not (frappe.conf.read_from_replica and frappe.conf.replica_host):
+			frappe.msgprint(
+				_("No read replica is configured for this site, so reads will stay on the primary."),
+				indicator="orange",
+				alert=True,
+			)
+
+		self.validate_conversion_doctypes()
+		self.validate_phone_region()
+
+	def on_update(self):
+		# Drop what is derived from these settings: the link map used by targeted conversion
+		# and this worker's rate limit, profiler and tracing snapshots
+		from ghost.conversion import clear_link_map
+		from ghost.profiler import clear_config as clear_profiler_config
+		from ghost.rate_limiter import clear_limits
+		from ghost.tracing import clear_config as clear_tracing_config
+
+		clear_link_map()
+		clear_limits()
+		clear_profiler_config()
+		clear_tracing_config()
+
+		# Numbers stored in local form were read in the old region (or none); re-read them
+		if self.default_phone_region and self.has_value_changed("default_phone_region"):
+			frappe.enqueue(
+				"ghost.phone.normalize_user_mobiles",
+				queue="long",
+				job_id="ghost_normalize_user_mobiles",
+				deduplicate=True,
+				enqueue_after_commit=True,
+				region=self.default_phone_region,
+			)
+
+	def validate_phone_region(self):
+		import phonenumbers
+
+		if not self.default_phone_region:
+			return
+
+		self.default_phone_region = self.default_phone_region.strip().upper()
+		if self.default_phone_region not in phonenumbers.SUPPORTED_REGIONS:
+			frappe.throw(_("Default Phone Region must be a two-letter country code such as IN or US."))
+
+	def validate_conversion_doctypes(self):
+		"""Targeted conversion only moves data it knows about, so it needs an explicit allow-list"""
+		from ghost.conversion import get_conversion_doctypes
+
+		if self.conversion_mode != "Targeted":
+			return
+
+		doctypes = get_conversion_doctypes(self)
+		if not doctypes:
+			frappe.throw(_("Conversion DocTypes are required when Conversion Mode is Targeted."))
+
+		missing = [d for d in doctypes if not frappe.db.exists("DocType", d)]
+		if missing:
+			frappe.throw(_("Unknown Conversion DocTypes: {0}").format(", ".join(missing)))
 	
 	def set_default_values(self):
 		"""Set default values for OAuth settings if not already set"""
@@ -55,6 +124,9 @@ class GhostSettings(Document):
 		if not self.otp_delivery_type:
 			self.otp_delivery_type = "Email"
 
+		if not self.conversion_mode:
+			self.conversion_mode = "Rename"
+
 		# Sandbox defaults
 		if not getattr(self, "sandbox_otp", None):
 			self.sandbox_otp = "000141"
@@ -9,11 +9,17 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import add_to_date, get_datetime, now_datetime
 
+from ghost import funnel
+from ghost.phone import normalize_phone
+from ghost.replica import replica
 from ghost.sender import send_otp
+from ghost.tracing import traced
 
 
 class OTP(Document):
 	def validate(self):
+		if self.phone:
+			self.phone = normalize_phone(self.phone)
 		if not self.expiry:
 			self.set_expiry()
 		self.check_expiry()
@@ -47,8 +53,12 @@ class OTP(Document):
 			frappe.db.set_value("OTP", otp.name, "status", "Expired")
 
 
+@traced("otp.generate")
 def generate(email=None, phone=None, purpose=None, user=None, send=True):
-	settings = frappe.get_single("Ghost Settings")
+	with replica():
+		settings = frappe.get_single("Ghost Settings")
+	if phone:
+		phone = normalize_phone(phone, region=settings.default_phone_region)
 	delivery_method = settings.otp_delivery_type or "Email"
 
 	# ── Sandbox short-circuit ────────────────────────────────────────────────
@@ -132,6 +142,9 @@ def generate(email=None, phone=None, purpose=None, user=None, send=True):
 				message=f"OTP generated but failed to send: {frappe.get_traceback()}", title="OTP Generation"
 			)
 
+		if send_results:
+			funnel.count("otp_sent")
+
 
 
 
@@ -143,6 +156,7 @@ def generate(email=None, phone=None, purpose=None, user=None, send=True):
 	}
 
 
+@traced("otp.verify")
 def verify(otp_code, email=None, phone=None, purpose=None):
 	# ── Sandbox short-circuit ────────────────────────────────────────────────
 	# Use get_cached_doc so repeated verify() calls during a test run don't
@@ -156,56 +170,48 @@ def verify(otp_code, email=None, phone=None, purpose=None):
 		frappe.throw(_("Invalid OTP"))
 	# ─────────────────────────────────────────────────────────────────────────
 
-	otp_doc = None
 	if not purpose:
 		purpose = "Login"
+	if phone:
+		phone = normalize_phone(phone, region=settings.default_phone_region)
 
-	if email and frappe.db.exists(
-
-		"OTP", {"otp_code": otp_code, "email": email, "status": "Valid", "purpose": purpose}
-	):
-		otp_doc = frappe.get_doc(
-			"OTP",
-			{"otp_code": otp_code, "email": email, "status": "Valid", "purpose": purpose},
-		)
-	elif phone and frappe.db.exists(
-		"OTP", {"otp_code": otp_code, "phone": phone, "status": "Valid", "purpose": purpose}
-	):
-		otp_doc = frappe.get_doc(
-			"OTP",
-			{"otp_code": otp_code, "phone": phone, "status": "Valid", "purpose": purpose},
-		)
-	
-	else:
-		settings = frappe.get_single("Ghost Settings")
-		if settings.allow_anonymous_otp and not email and not phone:
-			if frappe.db.exists(
-				"OTP", {"otp_code": otp_code, "status": "Valid", "purpose": purpose}
-			):
-				otp_doc = frappe.get_doc(
-					"OTP",
-					{"otp_code": otp_code, "status": "Valid", "purpose": purpose},
-				)
-
-
+	# One lookup per candidate match (usually just one), then the row is locked by name
+	# and consumed with a single UPDATE instead of loading and saving the whole document.
+	base_filters = {"otp_code": otp_code, "status": "Valid", "purpose": purpose}
+	candidates = []
+	if email:
+		candidates.append({**base_filters, "email": email})
+	if phone:
+		candidates.append({**base_filters, "phone": phone})
+	if not email and not phone and settings.allow_anonymous_otp:
+		candidates.append(base_filters)
 
+	otp = None
+	for filters in candidates:
+		otp = frappe.db.get_value("OTP", filters, ["name", "expiry"], as_dict=True)
+		if otp:
+			break
 
-	if not otp_doc:
+	if not otp:
 		frappe.throw(_("Invalid OTP"))
 
-
-	otp_doc.check_expiry()
-
-	if otp_doc.status == "Expired":
+	if otp.expiry and get_datetime(now_datetime()) > get_datetime(otp.expiry):
 		frappe.throw(_("OTP has expired"))
 
-	otp_doc.status = "Expired"
-	otp_doc.save(ignore_permissions=True)
+	if frappe.db.get_value("OTP", otp.name, "status", for_update=True) != "Valid":
+		# Consumed by a concurrent request between the lookup and the lock
+		frappe.throw(_("Invalid OTP"))
+
+	frappe.db.sql(
+		"UPDATE `tabOTP` SET status = 'Expired', modified = %s, modified_by = %s WHERE name = %s",
+		(now_datetime(), frappe.session.user, otp.name),
+	)
 
 	return {"valid": True}
 
 
 def get_user_otps(user=None, phone=None, email=None):
+	# Only feeds the hourly rate limit, which tolerates replication lag
 	filters = {"creation": [">=", add_to_date(now_datetime(), hours=-1)]}
 	if user:
 		filters["user"] = user
@@ -213,4 +219,5 @@ def get_user_otps(user=None, phone=None, email=None):
 		filters["phone"] = phone
 	if email:
 		filters["email"] = email
-	return frappe.get_all("OTP", filters=filters)
+	with replica():
+		return frappe.get_all("OTP", filters=filters)
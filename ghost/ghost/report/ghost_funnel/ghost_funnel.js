@@ -0,0 +1,21 @@
+// Copyright (c) 2026, Muneeb Mohammed and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Ghost Funnel"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_days(frappe.datetime.get_today(), -29),
+			reqd: 1,
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+			reqd: 1,
+		},
+	],
+};
@@ -0,0 +1,73 @@
+"""
+Lean ghost User rows.
+
+A ghost only needs its User row and its role row. `insert_ghost_user` writes
+exactly those, with the values the User controller would derive for the fields
+Ghost uses (name, full name, user type, time zone), and skips the side effects
+meant for real accounts: Contact and Notification Settings creation, username
+and password checks, role profiles and the welcome email.
+
+`materialize_user` runs the full controller once, when a ghost User is renamed
+into a real account.
+
+`get_ghost_role` and `get_user_role` resolve the roles from Ghost Settings; every
+path that assigns or checks those roles goes through them.
+"""
+
+import frappe
+from frappe.utils import get_system_timezone
+
+DEFAULT_GHOST_ROLE = "Ghost"
+DEFAULT_USER_ROLE = "Website User"
+
+
+def get_ghost_role(settings):
+	"""Role given to ghost users (install.py creates the default one)."""
+	return settings.ghost_role or DEFAULT_GHOST_ROLE
+
+
+def get_user_role(settings):
+	"""Role given to real users on signup and conversion, or None when there is none to give."""
+	if settings.default_user_role:
+		return settings.default_user_role
+	if frappe.db.exists("Role", DEFAULT_USER_ROLE):
+		return DEFAULT_USER_ROLE
+
+
+def insert_ghost_user(email, role):
+	"""Insert the ghost User and its role without the User controller. Returns the in-memory doc."""
+	user = frappe.new_doc("User")
+	user.update(
+		{
+			"email": email,
+			"first_name": "Ghost",
+			"last_name": "User",
+			"full_name": "Ghost User",
+			"enabled": 1,
+			"send_welcome_email": 0,
+			# Mirrors User.set_system_user and User.set_time_zone
+			"user_type": "System User"
+			if frappe.get_cached_value("Role", role, "desk_access")
+			else "Website User",
+			"time_zone": get_system_timezone(),
+		}
+	)
+	user.append("roles", {"role": role})
+
+	# Same naming as insert(): User.autoname lower-cases the email into the name
+	user.set_new_name()
+	user.set_parent_in_children()
+	user.set_user_and_timestamp()
+
+	user.db_insert()
+	for row in user.roles:
+		row.db_insert()
+	return user
+
+
+def materialize_user(name):
+	"""Run the User controller side effects a lean ghost insert skipped, as for a new account."""
+	user = frappe.get_doc("User", name)
+	user.save(ignore_permissions=True)
+	user.run_method("after_insert")
+	return user
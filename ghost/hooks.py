@@ -11,7 +11,13 @@ after_install = "ghost.install.after_install"
 
 # Migrations
 # ------------
-after_migrate = "ghost.patches.v1_0.set_ghost_settings_defaults.execute"
+after_migrate = [
+	"ghost.patches.v1_0.set_ghost_settings_defaults.execute",
+	"ghost.conversion.clear_link_map",
+	"ghost.install.create_oauth_client_fields",
+	"ghost.oauth.clear_client_cache",
+	"ghost.warmup.warm_up",
+]
 
 
 # Apps
@@ -146,13 +152,24 @@ after_migrate = "ghost.patches.v1_0.set_ghost_settings_defaults.execute"
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"User": {
+		"validate": "ghost.phone.normalize_user_mobile",
+		"on_update": "ghost.phone.clear_mobile_cache",
+		"on_trash": "ghost.phone.clear_mobile_cache",
+		"after_rename": "ghost.phone.clear_mobile_cache",
+	},
+	"OAuth Client": {
+		"validate": "ghost.oauth.validate_client_policy",
+		"on_update": "ghost.oauth.clear_client_cache",
+		"on_trash": "ghost.oauth.clear_client_cache",
+		"after_rename": "ghost.oauth.clear_client_cache",
+	},
+	"OAuth Bearer Token": {
+		"on_update": "ghost.tokens.purge_token_cache",
+		"on_trash": "ghost.tokens.purge_token_cache",
+	},
+}
 
 # Scheduled Tasks
 # ---------------
@@ -164,8 +181,14 @@ scheduler_events = {
 		"ghost.tasks.delete_expired_ghost_users"
 	],
 	"cron": {
+		"*/5 * * * *": [
+			"ghost.tasks.flush_ghost_activity"
+		],
 		"*/10 * * * *": [
 			"ghost.tasks.expire_otps"
+		],
+		"*/15 * * * *": [
+			"ghost.tasks.flush_ghost_funnel"
 		]
 	}
 }
@@ -201,13 +224,13 @@ scheduler_events = {
 
 # Request Events
 # ----------------
-# before_request = ["ghost.utils.before_request"]
-# after_request = ["ghost.utils.after_request"]
+before_request = ["ghost.warmup.warm_worker"]
+after_request = ["ghost.activity.record_activity", "ghost.replica.close_replica"]
 
 # Job Events
 # ----------
 # before_job = ["ghost.utils.before_job"]
-# after_job = ["ghost.utils.after_job"]
+after_job = ["ghost.replica.close_replica"]
 
 # User Data Protection
 # --------------------
@@ -243,9 +266,9 @@ scheduler_events = {
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+default_log_clearing_doctypes = {
+	"Ghost Job Log": 30  # days to retain logs
+}
 
 # Translation
 # ------------
@@ -1,8 +1,11 @@
 import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
 
 def after_install():
 	create_ghost_role()
+	create_introspection_role()
 	setup_default_settings()
+	create_oauth_client_fields()
 
 def create_ghost_role():
 	if not frappe.db.exists("Role", "Ghost"):
@@ -12,9 +15,53 @@ def create_ghost_role():
 			"desk_access": 0
 		}).insert(ignore_permissions=True)
 
+def create_introspection_role():
+	"""For the gateway users that call ghost.api.auth.introspect_token"""
+	from ghost.tokens import INTROSPECTION_ROLE
+
+	if not frappe.db.exists("Role", INTROSPECTION_ROLE):
+		frappe.get_doc({
+			"doctype": "Role",
+			"role_name": INTROSPECTION_ROLE,
+			"desk_access": 0
+		}).insert(ignore_permissions=True)
+
 def setup_default_settings():
 	settings = frappe.get_single("Ghost Settings")
 	settings.enable_ghost_feature = 1
 	settings.enable_auto_cleanup = 1
 	settings.ghost_role = "Ghost"
 	settings.save()
+
+def create_oauth_client_fields():
+	"""Per-client token policy. Blank values fall back to Ghost Settings."""
+	create_custom_fields({
+		"OAuth Client": [
+			{
+				"fieldname": "ghost_token_policy_section",
+				"fieldtype": "Section Break",
+				"label": "Ghost Token Policy",
+				"insert_after": "scopes",
+				"collapsible": 1,
+			},
+			{
+				"fieldname": "ghost_token_scope",
+				"fieldtype": "Data",
+				"label": "Token Scope",
+				"insert_after": "ghost_token_policy_section",
+			},
+			{
+				"fieldname": "ghost_access_token_expiry_seconds",
+				"fieldtype": "Int",
+				"label": "Access Token Expiry (Seconds)",
+				"description": "At least 300. Leave empty to use Ghost Settings.",
+				"insert_after": "ghost_token_scope",
+			},
+			{
+				"fieldname": "ghost_refresh_token_expiry_days",
+				"fieldtype": "Int",
+				"label": "Refresh Token Expiry (Days)",
+				"insert_after": "ghost_access_token_expiry_seconds",
+			},
+		]
+	}, update=True)
@@ -0,0 +1,92 @@
+"""
+Run bookkeeping for Ghost scheduled jobs.
+
+`scheduled_job` takes a Redis lock per job, so a run that is still going when the
+next cron tick fires makes that tick skip instead of fighting over row locks,
+and writes one Ghost Job Log per run: start, duration, rows processed, batches,
+errors and whether the run stopped early to stay within its time budget.
+"""
+
+import time
+from functools import wraps
+
+import frappe
+from frappe.utils import now_datetime
+
+from ghost.locks import redis_lock
+
+
+class JobRun:
+	"""Passed to the job as `run`: report progress and check the time budget through it."""
+
+	def __init__(self, time_budget):
+		self.time_budget = time_budget
+		self.started = time.monotonic()
+		self.rows_processed = 0
+		self.batches = 0
+		self.errors = 0
+		self.hit_time_budget = False
+
+	def add_batch(self, rows):
+		self.rows_processed += rows
+		self.batches += 1
+
+	def add_error(self):
+		self.errors += 1
+
+	def out_of_time(self):
+		"""True once the budget is spent; the job should stop and leave the rest for the next run."""
+		if time.monotonic() - self.started >= self.time_budget:
+			self.hit_time_budget = True
+		return self.hit_time_budget
+
+
+def scheduled_job(name, time_budget):
+	"""
+	`time_budget` (seconds) should stay below the job's schedule interval. The lock
+	outlives it by a margin, so a crashed run cannot block the job for longer.
+	"""
+
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			started = now_datetime()
+			with redis_lock(f"job:{name}", timeout=time_budget * 2, blocking_timeout=0) as acquired:
+				if not acquired:
+					write_log(name, "Skipped", started, 0, JobRun(time_budget))
+					return {"skipped": True}
+
+				run = JobRun(time_budget)
+				try:
+					result = fn(*args, run=run, **kwargs)
+				except Exception:
+					frappe.db.rollback()
+					write_log(
+						name, "Failed", started, time.monotonic() - run.started, run, frappe.get_traceback()
+					)
+					raise
+
+				write_log(name, "Success", started, time.monotonic() - run.started, run)
+				return result
+
+		return wrapper
+
+	return decorator
+
+
+def write_log(job, status, started, duration, run, error=None):
+	frappe.get_doc(
+		{
+			"doctype": "Ghost Job Log",
+			"job": job,
+			"status": status,
+			"started": started,
+			"duration": round(duration, 3),
+			"rows_processed": run.rows_processed,
+			"batches": run.batches,
+			"errors": run.errors,
+			"hit_time_budget": run.hit_time_budget,
+			"error": error,
+		}
+	).insert(ignore_permissions=True)
+	frappe.db.commit()
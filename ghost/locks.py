@@ -0,0 +1,81 @@
+"""
+Redis-backed locks shared by every worker of a site.
+"""
+
+from contextlib import contextmanager
+
+import frappe
+from frappe import _
+from redis.exceptions import LockError
+
+LOCK_TIMEOUT = 60
+SINGLE_FLIGHT_WAIT = 30
+SINGLE_FLIGHT_RESULT_TTL = 300
+
+
+@contextmanager
+def redis_lock(name, timeout=LOCK_TIMEOUT, blocking_timeout=None):
+	"""
+	Hold a distributed lock for the duration of the block. Yields whether it was acquired.
+	`blocking_timeout=0` tries once without waiting; `None` waits until the lock is free.
+	`timeout` caps how long a crashed holder can keep the lock.
+	"""
+	cache = frappe.cache()
+	lock = cache.lock(cache.make_key(f"ghost_lock:{name}"), timeout=timeout)
+
+	if blocking_timeout == 0:
+		acquired = lock.acquire(blocking=False)
+	else:
+		acquired = lock.acquire(blocking=True, blocking_timeout=blocking_timeout)
+
+	try:
+		yield acquired
+	finally:
+		if acquired:
+			try:
+				lock.release()
+			except LockError:
+				# Held past `timeout` and already expired
+				pass
+
+
+def single_flight(
+	name,
+	fn,
+	result_key=None,
+	lock_timeout=LOCK_TIMEOUT,
+	wait_timeout=SINGLE_FLIGHT_WAIT,
+	result_ttl=SINGLE_FLIGHT_RESULT_TTL,
+	shared_result=None,
+):
+	"""
+	Run `fn` once for concurrent callers sharing `name`.
+
+	The first caller runs `fn` under the lock and caches its result under `result_key`;
+	duplicates wait for the lock and get that cached result instead of redoing the work.
+	`shared_result` maps the result to what duplicates may see (e.g. without credentials).
+	"""
+	result_key = f"ghost_single_flight:{result_key or name}"
+	cache = frappe.cache()
+
+	# expires=True skips the request-local cache, so every read goes to Redis
+	result = cache.get_value(result_key, expires=True)
+	if result is not None:
+		return result
+
+	with redis_lock(name, timeout=lock_timeout, blocking_timeout=wait_timeout) as acquired:
+		if not acquired:
+			frappe.throw(
+				_("This request is already being processed. Please try again shortly."),
+				frappe.DocumentLockedError,
+			)
+
+		result = cache.get_value(result_key, expires=True)
+		if result is not None:
+			return result
+
+		result = fn()
+		cache.set_value(
+			result_key, shared_result(result) if shared_result else result, expires_in_sec=result_ttl
+		)
+		return result
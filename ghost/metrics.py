@@ -0,0 +1,187 @@
+"""
+Latency, outcome and query-count metrics for Ghost endpoints and jobs.
+
+`instrument` records every call into Redis hashes shared by all workers (one
+pipelined round trip per call) and `render_prometheus` turns them into the
+Prometheus text format served by `ghost.api.metrics.prometheus`. It also hands
+sampled calls to `ghost.profiler`.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import frappe
+
+from ghost import profiler as profiling
+
+METRICS_KEY = "ghost_metrics"
+METRICS_INDEX_KEY = "ghost_metrics_index"
+
+# Histogram upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+@contextmanager
+def count_queries(record=False):
+	"""
+	Count SQL statements issued through frappe.db.sql inside the block.
+	With `record`, also keep each statement (without its values) and its duration.
+	"""
+	counter = {"queries": 0, "statements": []}
+	db = frappe.local.db
+	original_sql = db.sql
+
+	def _sql(*args, **kwargs):
+		counter["queries"] += 1
+		if not record:
+			return original_sql(*args, **kwargs)
+
+		start = time.perf_counter()
+		try:
+			return original_sql(*args, **kwargs)
+		finally:
+			query = str(args[0] if args else kwargs.get("query", ""))
+			counter["statements"].append(
+				{
+					"query": " ".join(query.split())[:2000],
+					"ms": round((time.perf_counter() - start) * 1000, 3),
+				}
+			)
+
+	db.sql = _sql
+	try:
+		yield counter
+	finally:
+		db.sql = original_sql
+
+
+def instrument(name, kind="api"):
+	"""Record latency, outcome and SQL statement count of every call under `name`."""
+
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			outcome = "success"
+			profiler = profiling.start() if profiling.should_profile() else None
+			start = time.perf_counter()
+			with count_queries(record=bool(profiler)) as counter:
+				try:
+					result = fn(*args, **kwargs)
+				except Exception as e:
+					outcome = classify_exception(e)
+					raise
+				else:
+					# Some endpoints report failures through the response instead of raising
+					response = getattr(frappe.local, "response", None) or {}
+					status = response.get("http_status_code") if kind == "api" else None
+					if status and int(status) >= 500:
+						outcome = "error"
+					elif status and int(status) >= 400:
+						outcome = "rejected"
+					return result
+				finally:
+					seconds = time.perf_counter() - start
+					if profiler:
+						profiling.finish(profiler, name, kind, outcome, seconds, counter["statements"])
+					record(name, kind, outcome, seconds, counter["queries"])
+
+		return wrapper
+
+	return decorator
+
+
+def classify_exception(e):
+	if isinstance(e, frappe.TooManyRequestsError):
+		return "rate_limited"
+	if isinstance(e, (frappe.AuthenticationError, frappe.PermissionError)):
+		return "denied"
+	if isinstance(e, frappe.ValidationError):
+		return "rejected"
+	return "error"
+
+
+def record(name, kind, outcome, seconds, queries):
+	"""Add one observation. Metrics must never break the call they measure."""
+	try:
+		cache = frappe.cache()
+		bucket = next((str(b) for b in LATENCY_BUCKETS if seconds <= b), "+Inf")
+		key = cache.make_key(f"{METRICS_KEY}:{kind}:{name}")
+
+		pipe = cache.pipeline()
+		pipe.sadd(cache.make_key(METRICS_INDEX_KEY), f"{kind}:{name}")
+		pipe.hincrby(key, f"outcome:{outcome}", 1)
+		pipe.hincrby(key, f"bucket:{bucket}", 1)
+		pipe.hincrbyfloat(key, "seconds_sum", seconds)
+		pipe.hincrby(key, "queries_sum", queries)
+		pipe.execute()
+	except Exception:
+		frappe.logger().warning(f"Ghost metrics: failed to record {kind}:{name}", exc_info=True)
+
+
+def get_metrics():
+	"""{(kind, name): {field: value}} for every instrumented call seen so far."""
+	cache = frappe.cache()
+	# Read through a pipeline: RedisWrapper.smembers / hgetall add the key prefix themselves
+	# and hgetall unpickles, while these hashes hold plain counters
+	pipe = cache.pipeline()
+	pipe.smembers(cache.make_key(METRICS_INDEX_KEY))
+	members = sorted(m.decode() for m in pipe.execute()[0])
+
+	for member in members:
+		pipe.hgetall(cache.make_key(f"{METRICS_KEY}:{member}"))
+
+	metrics = {}
+	for member, raw in zip(members, pipe.execute(), strict=True):
+		kind, name = member.split(":", 1)
+		metrics[(kind, name)] = {k.decode(): float(v) for k, v in raw.items()}
+	return metrics
+
+
+def reset_metrics():
+	cache = frappe.cache()
+	for member in cache.smembers(METRICS_INDEX_KEY):
+		cache.delete(cache.make_key(f"{METRICS_KEY}:{member.decode()}"))
+	cache.delete(cache.make_key(METRICS_INDEX_KEY))
+
+
+def render_prometheus(metrics=None):
+	"""Prometheus text exposition format (0.0.4)."""
+	metrics = get_metrics() if metrics is None else metrics
+	lines = [
+		"# HELP ghost_call_duration_seconds Latency of Ghost endpoints and jobs.",
+		"# TYPE ghost_call_duration_seconds histogram",
+	]
+	for (kind, name), values in metrics.items():
+		labels = f'kind="{kind}",name="{name}"'
+		cumulative = 0
+		for bound in LATENCY_BUCKETS:
+			cumulative += values.get(f"bucket:{bound}", 0)
+			lines.append(f'ghost_call_duration_seconds_bucket{{{labels},le="{bound}"}} {int(cumulative)}')
+		cumulative += values.get("bucket:+Inf", 0)
+		lines.append(f'ghost_call_duration_seconds_bucket{{{labels},le="+Inf"}} {int(cumulative)}')
+		lines.append(f"ghost_call_duration_seconds_sum{{{labels}}} {values.get('seconds_sum', 0)}")
+		lines.append(f"ghost_call_duration_seconds_count{{{labels}}} {int(cumulative)}")
+
+	lines += [
+		"# HELP ghost_calls_total Ghost endpoint and job calls by outcome.",
+		"# TYPE ghost_calls_total counter",
+	]
+	for (kind, name), values in metrics.items():
+		for field, value in sorted(values.items()):
+			if field.startswith("outcome:"):
+				outcome = field.split(":", 1)[1]
+				lines.append(
+					f'ghost_calls_total{{kind="{kind}",name="{name}",outcome="{outcome}"}} {int(value)}'
+				)
+
+	lines += [
+		"# HELP ghost_db_queries_total SQL statements issued by Ghost endpoints and jobs.",
+		"# TYPE ghost_db_queries_total counter",
+	]
+	for (kind, name), values in metrics.items():
+		lines.append(
+			f'ghost_db_queries_total{{kind="{kind}",name="{name}"}} {int(values.get("queries_sum", 0))}'
+		)
+
+	return "\n".join(lines) + "\n"
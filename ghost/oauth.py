@@ -0,0 +1,117 @@
+"""
+Per-worker cache of the OAuth Clients ghost tokens can be issued for, with each
+client's token policy.
+
+Token issuance (session creation, login, refresh, conversion) used to look the
+client up on every call. Clients almost never change, so each worker keeps them
+in memory and only compares a version number in Redis, which the OAuth Client
+doc events bump to invalidate every worker at once.
+"""
+
+import frappe
+from frappe import _
+
+CLIENT_VERSION_KEY = "ghost_oauth_client_version"
+
+# Custom fields added to OAuth Client (see ghost.install.create_oauth_client_fields)
+POLICY_FIELDS = ("ghost_token_scope", "ghost_access_token_expiry_seconds", "ghost_refresh_token_expiry_days")
+
+# Same floors as Ghost Settings
+MIN_ACCESS_TOKEN_EXPIRY = 300
+MIN_REFRESH_TOKEN_EXPIRY_DAYS = 1
+
+# site -> {"version": ..., "clients": {client_id: policy}}
+_client_cache = {}
+
+
+def get_client_policy(client_id):
+	"""
+	Token policy of an OAuth Client as a dict (blank values fall back to Ghost Settings),
+	or None if the client does not exist. Unknown ids are not cached so they cannot grow
+	the worker's memory.
+	"""
+	if not client_id:
+		return None
+
+	clients = _get_site_clients()
+	if client_id in clients:
+		return clients[client_id]
+
+	# Always from the primary: a lagging replica could put a stale policy back into
+	# the worker cache right after an invalidation, where it would stay until the next one
+	row = frappe.db.get_value("OAuth Client", client_id, "*", as_dict=True)
+	if not row:
+		return None
+
+	policy = frappe._dict({field: row.get(field) for field in POLICY_FIELDS})
+	clients[client_id] = policy
+	return policy
+
+
+def get_session_clients(settings):
+	"""OAuth Clients guest-facing ghost calls may name: the Ghost Settings client and its Session Clients."""
+	clients = {settings.client_id}
+	clients.update(line.strip() for line in (settings.session_client_ids or "").splitlines())
+	return frozenset(filter(None, clients))
+
+
+def resolve_session_client(client_id, settings):
+	"""
+	The client a guest-supplied `client_id` may get tokens for: itself when allow-listed,
+	else the Ghost Settings client. Guests must not pick any client's scope and expiry policy.
+	"""
+	if client_id and client_id in get_session_clients(settings):
+		return client_id
+	return settings.client_id
+
+
+def resolve_token_policy(client_id, settings):
+	"""Scopes and expiry for tokens issued to `client_id`: the client's overrides, else Ghost Settings."""
+	policy = get_client_policy(client_id) or {}
+	return frappe._dict(
+		scopes=policy.get("ghost_token_scope") or settings.ghost_token_scope or "all",
+		access_expiry_seconds=max(
+			MIN_ACCESS_TOKEN_EXPIRY,
+			int(
+				policy.get("ghost_access_token_expiry_seconds")
+				or settings.access_token_expiry_seconds
+				or 3600
+			),
+		),
+		refresh_expiry_days=max(
+			MIN_REFRESH_TOKEN_EXPIRY_DAYS,
+			int(policy.get("ghost_refresh_token_expiry_days") or settings.refresh_token_expiry_days or 30),
+		),
+	)
+
+
+def validate_client_policy(doc, method=None):
+	"""OAuth Client validate hook"""
+	expiry = doc.get("ghost_access_token_expiry_seconds")
+	if expiry and expiry < MIN_ACCESS_TOKEN_EXPIRY:
+		frappe.throw(_("Access Token Expiry should be at least 300 seconds (5 minutes) for security."))
+
+	refresh_days = doc.get("ghost_refresh_token_expiry_days")
+	if refresh_days and refresh_days < MIN_REFRESH_TOKEN_EXPIRY_DAYS:
+		frappe.throw(_("Refresh Token Expiry should be at least 1 day."))
+
+
+def clear_client_cache(doc=None, method=None, *args, **kwargs):
+	"""OAuth Client on_update / on_trash / after_rename hook: invalidate every worker's copy."""
+	_client_cache.pop(frappe.local.site, None)
+	# Other workers are invalidated only once the change is committed, so none of them
+	# can cache the old row under the new version
+	frappe.db.after_commit.add(_bump_client_version)
+
+
+def _bump_client_version():
+	frappe.cache().incr(frappe.cache().make_key(CLIENT_VERSION_KEY))
+	_client_cache.pop(frappe.local.site, None)
+
+
+def _get_site_clients():
+	version = frappe.cache().get(frappe.cache().make_key(CLIENT_VERSION_KEY))
+	entry = _client_cache.get(frappe.local.site)
+	if not entry or entry["version"] != version:
+		entry = _client_cache[frappe.local.site] = {"version": version, "clients": {}}
+	return entry["clients"]
@@ -63,6 +63,20 @@ def execute():
 		settings.expiration_days = 30
 		modified = True
 	
+	# Fields added after install have no stored value yet
+	added_field_defaults = {
+		"device_key_window_hours": 24,
+		"enable_session_rate_limit": 1,
+		"session_ip_burst": 20,
+		"session_ip_refill_per_hour": 100,
+		"session_global_burst": 1000,
+		"session_global_refill_per_hour": 10000,
+	}
+	for fieldname, value in added_field_defaults.items():
+		if not frappe.db.exists("Singles", {"doctype": "Ghost Settings", "field": fieldname}):
+			settings.set(fieldname, value)
+			modified = True
+	
 	# Save if modified
 	if modified:
 		settings.flags.ignore_validate = False  # We want validation to run
@@ -0,0 +1,48 @@
+"""
+Backfill the Ghost Identity registry from ghost users created before it existed.
+This is the last time Ghost needs the LIKE scan over tabUser.
+"""
+
+import frappe
+
+from ghost.ghost_user import get_ghost_role
+
+
+def execute():
+	settings = frappe.get_single("Ghost Settings")
+	ghost_domain = settings.ghost_email_domain or "guest.local"
+
+	users = frappe.db.sql(
+		"""
+		SELECT u.name, u.creation FROM `tabUser` u
+		WHERE u.email LIKE %s
+		AND u.name IN (
+			SELECT parent FROM `tabHas Role` WHERE role = %s
+		)
+		AND u.name NOT IN (SELECT name FROM `tabGhost Identity`)
+	""",
+		(f"%@{ghost_domain}", get_ghost_role(settings)),
+		as_dict=True,
+	)
+
+	if not users:
+		return
+
+	now = frappe.utils.now_datetime()
+	fields = [
+		"name",
+		"user",
+		"status",
+		"created",
+		"last_seen",
+		"creation",
+		"modified",
+		"owner",
+		"modified_by",
+	]
+	values = [
+		(u.name, u.name, "Active", u.creation, u.creation, now, now, "Administrator", "Administrator")
+		for u in users
+	]
+	frappe.db.bulk_insert("Ghost Identity", fields, values, ignore_duplicates=True)
+	print(f"✅ Registered {len(users)} existing ghost users in Ghost Identity")
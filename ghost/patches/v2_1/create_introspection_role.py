@@ -0,0 +1,9 @@
+"""
+Create the Ghost Token Introspector role on sites installed before token introspection.
+"""
+
+from ghost.install import create_introspection_role
+
+
+def execute():
+	create_introspection_role()
@@ -0,0 +1,16 @@
+"""
+Index tabUser.mobile_no for mobile login and bring existing numbers to E.164
+so they match the normalized lookups.
+"""
+
+import frappe
+
+from ghost.phone import normalize_user_mobiles
+
+
+def execute():
+	frappe.db.add_index("User", ["mobile_no"])
+
+	updated = normalize_user_mobiles()
+	if updated:
+		print(f"✅ Normalized {updated} User mobile numbers to E.164")
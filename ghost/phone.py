@@ -0,0 +1,97 @@
+"""
+Mobile number normalization and mobile -> User resolution.
+
+Numbers are stored in E.164 so lookups can match exactly against the indexed
+`tabUser.mobile_no` column, and resolved users are cached in Redis until the
+User changes.
+"""
+
+import re
+
+import frappe
+import phonenumbers
+from phonenumbers import NumberParseException, PhoneNumberFormat
+
+MOBILE_CACHE_KEY = "ghost_mobile_user"
+
+
+def normalize_phone(number, region=None):
+	"""
+	E.164 form of `number` ("+14155550123"). Numbers without a country code are read
+	in Ghost Settings > Default Phone Region. Unparseable input is returned with only
+	the formatting characters stripped.
+	"""
+	if not number:
+		return number
+
+	cleaned = re.sub(r"[^\d+]", "", str(number))
+	if region is None:
+		region = frappe.get_cached_value("Ghost Settings", "Ghost Settings", "default_phone_region")
+
+	try:
+		parsed = phonenumbers.parse(cleaned, (region or "").upper() or None)
+	except NumberParseException:
+		return cleaned
+
+	if not phonenumbers.is_possible_number(parsed):
+		return cleaned
+
+	return phonenumbers.format_number(parsed, PhoneNumberFormat.E164)
+
+
+def get_user_by_mobile(mobile_no):
+	"""
+	User name for an already normalized mobile number, served from Redis when possible.
+	Misses are read from the primary, never the read replica, since the cache does not expire.
+	"""
+	if not mobile_no:
+		return None
+
+	user = frappe.cache().hget(MOBILE_CACHE_KEY, mobile_no)
+	if user:
+		return user
+
+	user = frappe.db.get_value("User", {"mobile_no": mobile_no}, "name")
+	if user:
+		frappe.cache().hset(MOBILE_CACHE_KEY, mobile_no, user)
+	return user
+
+
+def normalize_user_mobiles(region=None):
+	"""
+	Bring stored User mobile numbers to E.164. Numbers saved before a Default Phone
+	Region was set (or under another one) may still be in local form. Returns the count updated.
+	"""
+	if region is None:
+		region = frappe.db.get_single_value("Ghost Settings", "default_phone_region")
+
+	users = frappe.get_all("User", filters={"mobile_no": ["is", "set"]}, fields=["name", "mobile_no"])
+
+	updated = 0
+	for user in users:
+		normalized = normalize_phone(user.mobile_no, region=region)
+		if normalized != user.mobile_no:
+			frappe.db.set_value("User", user.name, "mobile_no", normalized, update_modified=False)
+			updated += 1
+
+	if updated:
+		# Cached entries are keyed by the numbers that just changed
+		frappe.cache().delete_value(MOBILE_CACHE_KEY)
+	return updated
+
+
+def normalize_user_mobile(doc, method=None):
+	"""User validate hook"""
+	if doc.mobile_no:
+		doc.mobile_no = normalize_phone(doc.mobile_no)
+
+
+def clear_mobile_cache(doc, method=None, *args, **kwargs):
+	"""User on_update / on_trash / after_rename hook"""
+	numbers = {doc.mobile_no}
+	before = doc.get_doc_before_save()
+	if before:
+		numbers.add(before.mobile_no)
+
+	for number in filter(None, numbers):
+		frappe.cache().hdel(MOBILE_CACHE_KEY, number)
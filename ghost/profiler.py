@@ -0,0 +1,132 @@
+"""
+Opt-in sampling profiler for Ghost endpoints and scheduler jobs.
+
+A fraction of the calls wrapped by `ghost.metrics.instrument` (Ghost Settings >
+Profile Sample Rate) run under cProfile with their SQL statements and timings
+recorded. Only the slowest N profiles are kept, in Redis, and System Managers
+download them as `.pstats` files (snakeviz, flameprof or gprof2dot turn those
+into call graphs and flamegraphs) through `ghost.api.metrics`.
+"""
+
+import cProfile
+import marshal
+import random
+import time
+
+import frappe
+from frappe.utils import now_datetime
+
+PROFILES_INDEX_KEY = "ghost_profiles"
+PROFILE_KEY = "ghost_profile"
+PROFILE_TTL = 7 * 24 * 60 * 60
+CONFIG_TTL = 30
+
+# site -> (loaded at, sample rate, profiles kept)
+_config = {}
+
+
+def should_profile():
+	"""Sampling decision, from a per-worker settings snapshot. Profiles never nest."""
+	if getattr(frappe.local, "ghost_profiling", False):
+		return False
+
+	sample_rate, _keep = get_config()
+	return sample_rate > 0 and random.random() < sample_rate
+
+
+def start():
+	"""Returns the running profiler, or None if another profiler already owns the interpreter."""
+	profiler = cProfile.Profile()
+	try:
+		profiler.enable()
+	except ValueError:
+		return None
+
+	frappe.local.ghost_profiling = True
+	return profiler
+
+
+def finish(profiler, name, kind, outcome, seconds, statements):
+	"""Stop `profiler` and keep its result if it is among the slowest N. Never raises."""
+	profiler.disable()
+	frappe.local.ghost_profiling = False
+
+	try:
+		_rate, keep = get_config()
+		cache = frappe.cache()
+		index_key = cache.make_key(PROFILES_INDEX_KEY)
+
+		# Store full: only a slower call than the fastest kept one gets in
+		if cache.zcard(index_key) >= keep:
+			fastest = cache.zrange(index_key, 0, 0, withscores=True)
+			if fastest and seconds <= fastest[0][1]:
+				return
+
+		profiler.create_stats()
+		profile_id = frappe.generate_hash(length=12)
+		cache.set_value(
+			f"{PROFILE_KEY}:{profile_id}",
+			{
+				"id": profile_id,
+				"name": name,
+				"kind": kind,
+				"outcome": outcome,
+				"seconds": round(seconds, 4),
+				"user": frappe.session.user if getattr(frappe.local, "session", None) else None,
+				"captured_at": str(now_datetime()),
+				"statements": statements or [],
+				"pstats": marshal.dumps(profiler.stats),
+			},
+			expires_in_sec=PROFILE_TTL,
+		)
+		cache.zadd(index_key, {profile_id: seconds})
+
+		# Evict the fastest ones beyond the limit
+		overflow = cache.zcard(index_key) - keep
+		if overflow > 0:
+			for evicted, _score in cache.zpopmin(index_key, overflow):
+				cache.delete_value(f"{PROFILE_KEY}:{evicted.decode()}")
+	except Exception:
+		frappe.logger().warning(f"Ghost profiler: failed to store profile of {kind}:{name}", exc_info=True)
+
+
+def get_profiles():
+	"""Kept profiles, slowest first, without their payload."""
+	cache = frappe.cache()
+	profiles = []
+	for profile_id in cache.zrevrange(cache.make_key(PROFILES_INDEX_KEY), 0, -1):
+		profile = get_profile(profile_id.decode())
+		if profile:
+			profile.pop("pstats")
+			profile["statement_count"] = len(profile.pop("statements"))
+			profiles.append(profile)
+	return profiles
+
+
+def get_profile(profile_id):
+	return frappe.cache().get_value(f"{PROFILE_KEY}:{profile_id}", expires=True)
+
+
+def clear_profiles():
+	cache = frappe.cache()
+	index_key = cache.make_key(PROFILES_INDEX_KEY)
+	for profile_id in cache.zrange(index_key, 0, -1):
+		cache.delete_value(f"{PROFILE_KEY}:{profile_id.decode()}")
+	cache.delete(index_key)
+
+
+def get_config():
+	site = frappe.local.site
+	cached = _config.get(site)
+	if cached and time.monotonic() - cached[0] < CONFIG_TTL:
+		return cached[1], cached[2]
+
+	settings = frappe.get_cached_doc("Ghost Settings")
+	sample_rate = min(1.0, max(0.0, float(settings.profile_sample_rate or 0)))
+	keep = int(settings.profile_keep_slowest or 20)
+	_config[site] = (time.monotonic(), sample_rate, keep)
+	return sample_rate, keep
+
+
+def clear_config():
+	_config.pop(frappe.local.site, None)
@@ -0,0 +1,187 @@
+"""
+Token-bucket rate limiting for unauthenticated ghost endpoints.
+
+Every bucket (per IP, per OAuth client and global) refills continuously and
+allows bursts up to its capacity, so a carrier NAT sharing one IP is not locked
+out for an hour while a distributed flood still runs dry on the global bucket.
+
+All buckets of a request are checked and consumed in one Lua call. The limits
+come from a per-worker snapshot of Ghost Settings and recently rejected keys are
+remembered in the worker, so a rejected request never loads settings or touches
+the database, and a repeat offender does not even reach Redis.
+"""
+
+import time
+from functools import wraps
+
+import frappe
+from frappe import _
+
+from ghost.oauth import get_session_clients
+
+CONFIG_TTL = 30
+BUCKET_KEY_PREFIX = "ghost_bucket"
+
+# Consume one token from every bucket, or from none of them.
+# KEYS: bucket hashes. ARGV: now, then capacity and refill rate (tokens/second) per key.
+# Returns {allowed, seconds until every bucket has a token again}, followed by
+# (key index, seconds until it has a token again) for every empty bucket.
+BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local allowed = 1
+local retry_after = 0
+local empty = {}
+
+for i, key in ipairs(KEYS) do
+	local capacity = tonumber(ARGV[i * 2])
+	local rate = tonumber(ARGV[i * 2 + 1])
+	local state = redis.call('HMGET', key, 'tokens', 'ts')
+	local tokens = capacity
+	if state[1] then
+		tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+	end
+	levels[i] = tokens
+	if tokens < 1 then
+		local wait = math.ceil((1 - tokens) / rate)
+		allowed = 0
+		retry_after = math.max(retry_after, wait)
+		table.insert(empty, i)
+		table.insert(empty, wait)
+	end
+end
+
+for i, key in ipairs(KEYS) do
+	local capacity = tonumber(ARGV[i * 2])
+	local rate = tonumber(ARGV[i * 2 + 1])
+	local tokens = levels[i]
+	if allowed == 1 then
+		tokens = tokens - 1
+	end
+	redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+	redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+
+local result = {allowed, retry_after}
+for _, value in ipairs(empty) do
+	table.insert(result, value)
+end
+return result
+"""
+
+_bucket_script = None
+# site -> (loaded at, {"limits": [(scope, capacity, refill per second)], "clients": ..., "default_client": ...})
+_limits = {}
+# (site, bucket key) -> monotonic time until which the bucket is known to be empty
+_rejected = {}
+# Bound on remembered empty buckets, so a distributed flood cannot grow it forever
+MAX_REJECTED = 10000
+
+
+def token_bucket(endpoint):
+	"""Rate limit a whitelisted method with the Ghost Settings session buckets."""
+
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			check_rate_limit(endpoint)
+			return fn(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+def check_rate_limit(endpoint, client_id=None):
+	# Only HTTP requests are limited, not jobs, tests or the console
+	if not getattr(frappe.local, "request", None):
+		return
+
+	config = _get_config()
+	limits = config["limits"]
+	if not limits:
+		return
+
+	# Keyed on allow-listed clients only: a made-up client_id per call must not get a fresh bucket
+	client_id = client_id or frappe.form_dict.get("client_id")
+	if client_id not in config["clients"]:
+		client_id = config["default_client"] or "default"
+	identities = {"ip": frappe.local.request_ip or "unknown", "client": client_id, "global": "all"}
+
+	site = frappe.local.site
+	now = time.monotonic()
+	keys, args = [], [time.time()]
+	for scope, capacity, rate in limits:
+		key = f"{BUCKET_KEY_PREFIX}:{endpoint}:{scope}:{identities[scope]}"
+		blocked_until = _rejected.get((site, key))
+		if blocked_until:
+			if blocked_until > now:
+				_throw(blocked_until - now)
+			_rejected.pop((site, key), None)
+
+		keys.append(key)
+		args.extend([capacity, rate])
+
+	allowed, retry_after, *empty = _get_script()(keys=[frappe.cache().make_key(k) for k in keys], args=args)
+	if not allowed:
+		# Only the empty buckets are remembered: a full shared bucket must keep serving other callers
+		for index, wait in zip(empty[::2], empty[1::2], strict=True):
+			_remember_rejected((site, keys[index - 1]), now + wait, now)
+		_throw(retry_after)
+
+
+def get_limits():
+	"""Enabled buckets as (scope, capacity, refill per second), from a short-lived per-worker snapshot."""
+	return _get_config()["limits"]
+
+
+def _get_config():
+	site = frappe.local.site
+	cached = _limits.get(site)
+	if cached and time.monotonic() - cached[0] < CONFIG_TTL:
+		return cached[1]
+
+	settings = frappe.get_cached_doc("Ghost Settings")
+	limits = []
+	if settings.enable_session_rate_limit:
+		for scope in ("ip", "client", "global"):
+			capacity = int(settings.get(f"session_{scope}_burst") or 0)
+			refill = int(settings.get(f"session_{scope}_refill_per_hour") or 0)
+			if capacity > 0 and refill > 0:
+				limits.append((scope, capacity, refill / 3600))
+
+	config = {
+		"limits": limits,
+		"clients": get_session_clients(settings),
+		"default_client": settings.client_id,
+	}
+	_limits[site] = (time.monotonic(), config)
+	return config
+
+
+def clear_limits():
+	"""Drop this worker's snapshot (other workers pick up changes within CONFIG_TTL)."""
+	_limits.pop(frappe.local.site, None)
+
+
+def _remember_rejected(bucket, until, now):
+	if len(_rejected) >= MAX_REJECTED:
+		for expired in [b for b, blocked_until in _rejected.items() if blocked_until <= now]:
+			del _rejected[expired]
+		if len(_rejected) >= MAX_REJECTED:
+			_rejected.clear()
+	_rejected[bucket] = until
+
+
+def _get_script():
+	global _bucket_script
+	if _bucket_script is None:
+		_bucket_script = frappe.cache().register_script(BUCKET_SCRIPT)
+	return _bucket_script
+
+
+def _throw(retry_after):
+	frappe.throw(
+		_("Too many requests. Please try again in {0} seconds.").format(max(1, int(retry_after))),
+		frappe.TooManyRequestsError,
+	)
@@ -0,0 +1,64 @@
+"""
+Read-replica routing for lookups that can tolerate replication lag.
+
+With Ghost Settings > Use Read Replica on and a replica configured for the site
+(`read_from_replica` and `replica_host` in site_config.json), reads inside
+`with replica():` go to the replica. One replica connection is opened per request
+or job, reused by every block and closed by the after_request / after_job hooks.
+
+Anything that must read its own writes (OTP consumption, refresh rotation, the
+conversion itself) stays on the primary by simply not using this.
+"""
+
+from contextlib import contextmanager
+
+import frappe
+
+
+@contextmanager
+def replica():
+	if getattr(frappe.local, "ghost_on_replica", False) or not use_replica():
+		yield
+		return
+
+	primary = frappe.local.db
+	frappe.local.db = _get_replica_db()
+	frappe.local.ghost_on_replica = True
+	try:
+		yield
+	finally:
+		frappe.local.db = primary
+		frappe.local.ghost_on_replica = False
+
+
+def use_replica():
+	conf = frappe.local.conf
+	if not (conf.read_from_replica and conf.replica_host):
+		return False
+	return bool(frappe.get_cached_doc("Ghost Settings").use_read_replica)
+
+
+def close_replica(*args, **kwargs):
+	"""after_request / after_job hook"""
+	replica_db = getattr(frappe.local, "ghost_replica_db", None)
+	if replica_db:
+		frappe.local.ghost_replica_db = None
+		replica_db.close()
+
+
+def _get_replica_db():
+	replica_db = getattr(frappe.local, "ghost_replica_db", None)
+	if replica_db:
+		return replica_db
+
+	from frappe.database import get_db
+
+	# Same credentials resolution as frappe.connect_replica
+	conf = frappe.local.conf
+	user, password = conf.db_name, conf.db_password
+	if conf.different_credentials_for_replica:
+		user, password = conf.replica_db_name, conf.replica_db_password
+
+	replica_db = get_db(host=conf.replica_host, user=user, password=password, port=conf.replica_db_port)
+	frappe.local.ghost_replica_db = replica_db
+	return replica_db
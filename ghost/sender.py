@@ -3,8 +3,14 @@
 
 import frappe
 from frappe import _
+from frappe.utils import now_datetime
 
+from ghost.tracing import set_attribute, traced
 
+CAPTURE_CACHE_KEY = "ghost_captured_otp"
+
+
+@traced("sender.send_otp")
 def send_otp(otp_code, delivery_method, email=None, phone=None, **kwargs):
 	"""
 	Send OTP using the configured sender from settings
@@ -19,8 +25,19 @@ def send_otp(otp_code, delivery_method, email=None, phone=None, **kwargs):
 	Returns:
 	    dict: Result from sending or None if no sender configured
 	"""
+	set_attribute("delivery_method", delivery_method)
+
+	# Load tests swap the real providers for an in-process sink (see ghost.benchmarks.loadtest)
+	sink = frappe.flags.ghost_otp_sink
+	if sink is not None:
+		sink.record(otp_code, delivery_method, email=email, phone=phone)
+		return {"status": "sent", "method": "sink"}
+
 	settings = frappe.get_single("Ghost Settings")
 
+	if settings.otp_capture_mode:
+		return capture_otp(otp_code, delivery_method, email=email, phone=phone, settings=settings)
+
 	if delivery_method == "Email":
 		return send_otp_email(otp_code, email, settings, **kwargs)
 	elif delivery_method == "SMS":
@@ -29,14 +46,31 @@ def send_otp(otp_code, delivery_method, email=None, phone=None, **kwargs):
 	return None
 
 
+def capture_otp(otp_code, delivery_method, email=None, phone=None, settings=None):
+	"""Capture Mode: record the OTP in Redis, for as long as it is valid, instead of delivering it"""
+	settings = settings or frappe.get_single("Ghost Settings")
+	recipient = email if delivery_method == "Email" else phone
+
+	frappe.cache().set_value(
+		f"{CAPTURE_CACHE_KEY}:{recipient}",
+		{"otp_code": otp_code, "delivery_method": delivery_method, "captured_at": str(now_datetime())},
+		expires_in_sec=int(settings.expiry_time_minutes or 10) * 60,
+	)
+	return {"status": "sent", "method": "capture"}
+
+
+def get_captured_otp(recipient):
+	return frappe.cache().get_value(f"{CAPTURE_CACHE_KEY}:{recipient}", expires=True)
+
+
 def send_otp_email(otp_code, email, settings, **kwargs):
 	"""Send OTP via email using Frappe's sendmail with Email Template"""
 	if not settings.email_account or not settings.email_template:
 		return None
 
 	try:
-		email_account = frappe.get_doc("Email Account", settings.email_account)
-		email_template = frappe.get_doc("Email Template", settings.email_template)
+		email_account = frappe.get_cached_doc("Email Account", settings.email_account)
+		email_template = frappe.get_cached_doc("Email Template", settings.email_template)
 
 		doc = {"otp_code": otp_code, **kwargs}
 
@@ -1,9 +1,22 @@
 import frappe
-from frappe.utils import add_days, now_datetime
+from frappe.utils import add_days, create_batch, now_datetime
 
-def delete_expired_ghost_users():
+from ghost import funnel
+from ghost.activity import flush_activity
+from ghost.ghost.doctype.ghost_identity.ghost_identity import get_inactive_ghosts, mark_expired
+from ghost.jobs import scheduled_job
+from ghost.metrics import instrument
+from ghost.replica import replica
+
+CLEANUP_BATCH_SIZE = 100
+OTP_EXPIRE_BATCH_SIZE = 1000
+CLEANUP_SAVEPOINT = "ghost_cleanup_user"
+
+@instrument("delete_expired_ghost_users", kind="job")
+@scheduled_job("delete_expired_ghost_users", time_budget=30 * 60)
+def delete_expired_ghost_users(run):
 	"""
-	Deletes Ghost users that have exceeded the expiration days.
+	Deletes Ghost users that have been inactive for longer than the expiration days.
 	"""
 	settings = frappe.get_single("Ghost Settings")
 	if not settings.enable_ghost_feature or not settings.enable_auto_cleanup:
@@ -15,58 +28,91 @@ def delete_expired_ghost_users():
 		expiration_days = 1
 
 	expiry_date = add_days(now_datetime(), -expiration_days)
-	ghost_domain = settings.ghost_email_domain or "guest.local"
-
-	# Find users to delete
-	# Criteria:
-	# 1. Role contains 'Ghost' (Checked via User Role usually, but checking query is faster)
-	# 2. Email ends with ghost domain
-	# 3. Creation < expiry_date
-	# 4. Filter by specific 'Ghost' role to be safe.
-	
-	users = frappe.db.sql("""
-		SELECT name FROM `tabUser`
-		WHERE creation < %s
-		AND email LIKE %s
-		AND name IN (
-			SELECT parent FROM `tabHas Role` WHERE role = %s
-		)
-	""", (expiry_date, f"%@{ghost_domain}", settings.ghost_role), as_dict=True)
-
-	for u in users:
-		# Use frappe.delete_doc to ensure strict cleanup (links etc)
-		# This might be slow if there are thousands. 
-		# For extreme scalability, we might use bulk delete if no important links exist.
-		# But standard delete is safer for now.
-		try:
-			frappe.delete_doc("User", u.name, ignore_permissions=True, force=1)
-			# Commit every 100 to avoid long transaction? 
-			# frappe.db.commit() # optional, depends on volume
-		except Exception:
-			frappe.log_error(f"Failed to delete ghost user {u.name}", "Ghost Cleanup")
-
-
-def expire_otps():
+
+	# Persist buffered activity first so ghosts seen since the last flush are kept.
+	flush_activity()
+
+	# Candidates come from the Ghost Identity registry (indexed on status/last_seen),
+	# so we never scan tabUser with a leading-wildcard LIKE. The scan runs on the read
+	# replica; each batch is re-checked on the primary below, so a lagging replica can
+	# never expire a ghost whose activity was just flushed.
+	with replica():
+		users = get_inactive_ghosts(expiry_date)
+
+	# Committed per batch so a long cleanup never holds locks for the whole run;
+	# whatever is left when the time budget runs out is picked up by the next run.
+	for batch in create_batch(users, CLEANUP_BATCH_SIZE):
+		if run.out_of_time():
+			break
+
+		batch = get_inactive_ghosts(expiry_date, names=batch)
+		deleted = 0
+		for name in batch:
+			# A delete that fails halfway is undone, so the batch commit never keeps a half-deleted User
+			frappe.db.savepoint(CLEANUP_SAVEPOINT)
+			# Use frappe.delete_doc to ensure strict cleanup (links etc)
+			try:
+				if frappe.db.exists("User", name):
+					frappe.delete_doc("User", name, ignore_permissions=True, force=1)
+				mark_expired(name)
+				deleted += 1
+			except Exception:
+				frappe.db.rollback(save_point=CLEANUP_SAVEPOINT)
+				run.add_error()
+				frappe.log_error(f"Failed to delete ghost user {name}", "Ghost Cleanup")
+			else:
+				frappe.db.release_savepoint(CLEANUP_SAVEPOINT)
+
+		funnel.count("expired", deleted)
+		frappe.db.commit()
+		run.add_batch(deleted)
+
+	return {"deleted_count": run.rows_processed}
+
+
+@instrument("flush_ghost_activity", kind="job")
+@scheduled_job("flush_ghost_activity", time_budget=4 * 60)
+def flush_ghost_activity(run):
+	"""
+	Writes ghost last-seen timestamps buffered in Redis to Ghost Identity.
+	"""
+	return {"flushed_count": flush_activity(run=run)}
+
+
+@instrument("flush_ghost_funnel", kind="job")
+@scheduled_job("flush_ghost_funnel", time_budget=4 * 60)
+def flush_ghost_funnel(run):
+	"""
+	Writes the funnel counters buffered in Redis to Ghost Funnel Daily.
+	"""
+	return {"days_flushed": funnel.flush_funnel(run=run)}
+
+
+@instrument("expire_otps", kind="job")
+@scheduled_job("expire_otps", time_budget=5 * 60)
+def expire_otps(run):
 	"""
 	Scheduled function to expire OTPs that have passed their expiry time
 	This should be run periodically (e.g., every 5-10 minutes)
 	"""
-	try:
-		expired_otps = frappe.get_all(
-			"OTP", filters={"status": "Valid", "expiry": ["<", now_datetime()]}, fields=["name"]
+	now = now_datetime()
+
+	# Set-based and committed per batch instead of loading and saving every OTP
+	while not run.out_of_time():
+		names = frappe.get_all(
+			"OTP",
+			filters={"status": "Valid", "expiry": ["<", now]},
+			pluck="name",
+			limit=OTP_EXPIRE_BATCH_SIZE,
 		)
+		if not names:
+			break
 
-		count = 0
-		for otp in expired_otps:
-			try:
-				otp_doc = frappe.get_doc("OTP", otp.name)
-				otp_doc.status = "Expired"
-				otp_doc.save(ignore_permissions=True)
-				count += 1
-			except Exception as e:
-				frappe.log_error(f"Error expiring OTP {otp.name}: {e}", "OTP Expiration")
-
-		return {"expired_count": count}
-	except Exception as e:
-		frappe.log_error(f"Error in expire_otps scheduled function: {e}", "OTP Expiration")
-		return {"expired_count": 0, "error": e}
+		frappe.db.sql(
+			"UPDATE `tabOTP` SET status = 'Expired', modified = %s WHERE name IN %s AND status = 'Valid'",
+			(now, tuple(names)),
+		)
+		frappe.db.commit()
+		run.add_batch(len(names))
+
+	return {"expired_count": run.rows_processed}
@@ -1,6 +1,13 @@
-import frappe
 import unittest
-from ghost.api.ghost import create_ghost_session
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from ghost.api.ghost import convert_to_real_user, create_ghost_session
+from ghost.ghost.doctype.ghost_identity.ghost_identity import register as register_ghost
+from ghost.ghost_user import get_ghost_role
+
 
 class TestFrappeIdentityAPI(unittest.TestCase):
 	def setUp(self):
@@ -20,6 +27,8 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		settings.otp_delivery_type = "Email"
 		settings.verify_otp_on_conversion = 0
 		settings.default_user_role = None 
+		settings.conversion_mode = "Rename"
+		settings.async_conversion = 0
 		settings.save()
 
 	def test_create_ghost_session(self):
@@ -50,8 +59,54 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 	def tearDown(self):
 		pass
 
+	def test_ghost_identity_registered(self):
+		from ghost.ghost.doctype.ghost_identity.ghost_identity import is_ghost
+
+		result = create_ghost_session()
+		email = result["user"]
+
+		identity = frappe.db.get_value("Ghost Identity", email, ["status", "created", "last_seen"], as_dict=True)
+		self.assertEqual(identity.status, "Active")
+		self.assertEqual(identity.created, identity.last_seen)
+		self.assertTrue(is_ghost(email))
+		self.assertFalse(is_ghost("Administrator"))
+
+	def test_create_ghost_session_with_email(self):
+		domain = frappe.db.get_single_value("Ghost Settings", "ghost_email_domain") or "guest.local"
+		email = f"chosen_{frappe.generate_hash(length=6)}@{domain}"
+
+		self.assertEqual(create_ghost_session(email=email)["user"], email)
+
+		# Never adopts an existing User, ghost or real
+		with self.assertRaises(frappe.DuplicateEntryError):
+			create_ghost_session(email=email)
+		with self.assertRaises(frappe.ValidationError):
+			create_ghost_session(email="Administrator@example.com")
+
+	def test_create_ghost_session_device_key(self):
+		from ghost.ghost.doctype.ghost_identity.ghost_identity import device_digest, mark_expired
+
+		frappe.db.set_single_value("Ghost Settings", "device_key_window_hours", 24)
+		device_key = frappe.generate_hash()
+
+		first = create_ghost_session(device_key=device_key)
+		second = create_ghost_session(device_key=device_key)
+
+		self.assertEqual(first["user"], second["user"])
+		self.assertNotEqual(first["access_token"], second["access_token"])
+		self.assertEqual(second["message"], "Ghost session resumed")
+		self.assertEqual(
+			frappe.db.get_value("Ghost Identity", first["user"], "device_key"), device_digest(device_key)
+		)
+
+		# An expired ghost is never resumed, even while still cached
+		mark_expired(first["user"])
+		third = create_ghost_session(device_key=device_key)
+		self.assertNotEqual(third["user"], first["user"])
+
 	def test_cleanup_logic(self):
 		from frappe.utils import add_days, now_datetime
+
 		from ghost.tasks import delete_expired_ghost_users
 		
 		# Setup: Enable cleanup
@@ -63,7 +118,7 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		# Create Old Ghost (expired)
 		old_email = "old_ghost@guest.local"
 		if not frappe.db.exists("User", old_email):
-			u = frappe.get_doc({
+			frappe.get_doc({
 				"doctype": "User",
 				"email": old_email,
 				"first_name": "Old",
@@ -71,6 +126,9 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 			}).insert(ignore_permissions=True)
 			# Hack creation date
 			frappe.db.set_value("User", old_email, "creation", add_days(now_datetime(), -35))
+		if not frappe.db.exists("Ghost Identity", old_email):
+			register_ghost(old_email)
+		frappe.db.set_value("Ghost Identity", old_email, {"created": add_days(now_datetime(), -35), "last_seen": add_days(now_datetime(), -35)})
 		
 		# Create New Ghost (not expired)
 		new_email = "new_ghost@guest.local"
@@ -81,6 +139,8 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 				"first_name": "New",
 				"roles": [{"role": "Ghost"}]
 			}).insert(ignore_permissions=True)
+		if not frappe.db.exists("Ghost Identity", new_email):
+			register_ghost(new_email)
 
 		# Run Cleanup
 		delete_expired_ghost_users()
@@ -88,10 +148,70 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		# Verify
 		self.assertFalse(frappe.db.exists("User", old_email), "Old ghost should be deleted")
 		self.assertTrue(frappe.db.exists("User", new_email), "New ghost should be kept")
+		self.assertEqual(frappe.db.get_value("Ghost Identity", old_email, "status"), "Expired")
+		self.assertEqual(frappe.db.get_value("Ghost Identity", new_email, "status"), "Active")
 		print("\n[Success] Verified Cleanup: Old deleted, New kept.")
 
+	def test_cleanup_keeps_recently_active_ghost(self):
+		from frappe.utils import add_days, now_datetime
+
+		from ghost.activity import record_activity
+		from ghost.tasks import delete_expired_ghost_users
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.enable_auto_cleanup = 1
+		settings.expiration_days = 30
+		settings.save()
+
+		# Old ghost that is still using the app
+		ghost_email = create_ghost_session()["user"]
+		frappe.db.set_value("Ghost Identity", ghost_email, {"created": add_days(now_datetime(), -35), "last_seen": add_days(now_datetime(), -35)})
+
+		frappe.set_user(ghost_email)
+		try:
+			record_activity()
+		finally:
+			frappe.set_user("Administrator")
+
+		# Buffered in Redis only until flushed
+		self.assertLess(frappe.db.get_value("Ghost Identity", ghost_email, "last_seen"), add_days(now_datetime(), -30))
+
+		delete_expired_ghost_users()
+
+		self.assertTrue(frappe.db.exists("User", ghost_email), "Active ghost should be kept")
+		self.assertGreater(frappe.db.get_value("Ghost Identity", ghost_email, "last_seen"), add_days(now_datetime(), -1))
+
+	def test_activity_buffer_kept_until_flush_commits(self):
+		from ghost.activity import LAST_SEEN_KEY, flush_activity, record_activity
+
+		def buffered(user):
+			# Straight from Redis: hget also answers from this worker's local cache
+			cache = frappe.cache()
+			pipe = cache.pipeline()
+			pipe.hexists(cache.make_key(LAST_SEEN_KEY), user)
+			return pipe.execute()[0]
+
+		ghost_email = create_ghost_session()["user"]
+		frappe.db.commit()
+
+		frappe.set_user(ghost_email)
+		try:
+			record_activity()
+		finally:
+			frappe.set_user("Administrator")
+
+		# A rolled back flush leaves the buffer for the next one
+		self.assertGreaterEqual(flush_activity(), 1)
+		frappe.db.rollback()
+		self.assertTrue(buffered(ghost_email))
+
+		self.assertGreaterEqual(flush_activity(), 1)
+		frappe.db.commit()
+		self.assertFalse(buffered(ghost_email))
+
 	def test_cleanup_disabled(self):
 		from frappe.utils import add_days, now_datetime
+
 		from ghost.tasks import delete_expired_ghost_users
 
 		# Setup: DISABLE cleanup
@@ -102,13 +222,16 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		# Create Old Ghost
 		old_email = "kept_ghost@guest.local"
 		if not frappe.db.exists("User", old_email):
-			u = frappe.get_doc({
+			frappe.get_doc({
 				"doctype": "User",
 				"email": old_email,
 				"first_name": "Kept",
 				"roles": [{"role": "Ghost"}]
 			}).insert(ignore_permissions=True)
 			frappe.db.set_value("User", old_email, "creation", add_days(now_datetime(), -35))
+		if not frappe.db.exists("Ghost Identity", old_email):
+			register_ghost(old_email)
+		frappe.db.set_value("Ghost Identity", old_email, {"created": add_days(now_datetime(), -35), "last_seen": add_days(now_datetime(), -35)})
 
 		# Run Cleanup
 		delete_expired_ghost_users()
@@ -118,7 +241,7 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		print("\n[Success] Verified Control: Cleanup respects disabled setting.")
 
 	def test_convert_to_real_user(self):
-		from ghost.api.ghost import create_ghost_session, convert_to_real_user
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
 		
 		# 1. Create Ghost
 		ghost_data = create_ghost_session()
@@ -133,7 +256,7 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		if frappe.db.exists("User", real_email):
 			frappe.delete_doc("User", real_email, force=True)
 
-		result = convert_to_real_user(ghost_email, real_email, "Real", "Human")
+		convert_to_real_user(ghost_email, real_email, "Real", "Human")
 		
 		# 4. Verify
 		self.assertFalse(frappe.db.exists("User", ghost_email), "Ghost email should be renamed")
@@ -146,6 +269,10 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		roles = [r.role for r in user.roles]
 		self.assertNotIn("Ghost", roles, "Ghost role should be removed")
 		self.assertIn("Website User", roles, "Should have default role")
+
+		identity = frappe.db.get_value("Ghost Identity", ghost_email, ["status", "converted_to"], as_dict=True)
+		self.assertEqual(identity.status, "Converted")
+		self.assertEqual(identity.converted_to, real_email)
 		
 		print(f"\n[Success] Converted {ghost_email} -> {real_email}")
 
@@ -153,7 +280,7 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		"""
 		Test merging a Ghost User into an EXISTING Real User.
 		"""
-		from ghost.api.ghost import create_ghost_session, convert_to_real_user
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
 
 		# 1. Create Ghost
 		ghost_data = create_ghost_session()
@@ -191,11 +318,388 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 
 		print(f"\n[Success] Merged {ghost_email} -> {real_email}")
 
+	def test_convert_targeted_merge_existing(self):
+		"""
+		Targeted mode moves links in allow-listed doctypes without rename_doc.
+		"""
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Targeted"
+		settings.conversion_doctypes = "ToDo"
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+
+		real_email = "targeted_real@example.com"
+		if not frappe.db.exists("User", real_email):
+			u = frappe.new_doc("User")
+			u.email = real_email
+			u.first_name = "Targeted"
+			u.save(ignore_permissions=True)
+
+		todo = frappe.get_doc({"doctype": "ToDo", "description": "Ghost Task"}).insert(ignore_permissions=True)
+		todo.db_set({"owner": ghost_email, "allocated_to": ghost_email})
+
+		result = convert_to_real_user(ghost_email, real_email)
+
+		self.assertTrue(result.get("merged"))
+		self.assertFalse(frappe.db.exists("User", ghost_email), "Ghost user should be deleted")
+		todo.reload()
+		self.assertEqual(todo.owner, real_email)
+		self.assertEqual(todo.allocated_to, real_email)
+
+	def test_convert_targeted_new_user(self):
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Targeted"
+		settings.conversion_doctypes = "ToDo"
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+		real_email = "targeted_new@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=True)
+
+		result = convert_to_real_user(ghost_email, real_email, "Targeted", "Human")
+
+		self.assertFalse(result.get("merged"))
+		self.assertFalse(frappe.db.exists("User", ghost_email))
+		user = frappe.get_doc("User", real_email)
+		self.assertEqual(user.first_name, "Targeted")
+		self.assertNotIn("Ghost", [r.role for r in user.roles])
+
+	def test_convert_async(self):
+		"""
+		Async mode issues real tokens immediately and merges ghost data in a job.
+		"""
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session, get_conversion_status
+		from ghost.conversion import merge_ghost_job
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Targeted"
+		settings.conversion_doctypes = "ToDo"
+		settings.async_conversion = 1
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+		real_email = "async_real@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=True)
+
+		todo = frappe.get_doc({"doctype": "ToDo", "description": "Ghost Task"}).insert(ignore_permissions=True)
+		todo.db_set("owner", ghost_email)
+
+		result = convert_to_real_user(ghost_email, real_email)
+
+		self.assertEqual(result["merge_status"], "Queued")
+		self.assertTrue(frappe.db.exists("User", real_email))
+		self.assertTrue(frappe.db.exists("User", ghost_email), "Ghost is removed by the merge job")
+		self.assertEqual(get_conversion_status(ghost_email)["status"], "Converting")
+
+		merge_ghost_job(ghost_email, real_email)
+
+		status = get_conversion_status(ghost_email)
+		self.assertEqual(status["status"], "Converted")
+		self.assertEqual(status["merge_status"], "Completed")
+		self.assertFalse(frappe.db.exists("User", ghost_email))
+		todo.reload()
+		self.assertEqual(todo.owner, real_email)
+
+	def test_failed_merge_is_retried_then_marked(self):
+		"""
+		A failing background merge is re-enqueued, and marked Merge Failed once out of attempts.
+		"""
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session, get_conversion_status
+		from ghost.conversion import MERGE_ATTEMPTS, merge_ghost_job
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Targeted"
+		settings.conversion_doctypes = "ToDo"
+		settings.async_conversion = 1
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+		real_email = "failed_merge@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=True)
+		convert_to_real_user(ghost_email, real_email)
+
+		with patch("ghost.conversion.rewrite_links_chunked", side_effect=RuntimeError("boom")):
+			with patch("frappe.enqueue") as enqueue, self.assertRaises(RuntimeError):
+				merge_ghost_job(ghost_email, real_email)
+			self.assertEqual(enqueue.call_args.kwargs["attempt"], 2)
+			self.assertEqual(get_conversion_status(ghost_email)["status"], "Converting")
+
+			with self.assertRaises(RuntimeError):
+				merge_ghost_job(ghost_email, real_email, attempt=MERGE_ATTEMPTS)
+
+		status = get_conversion_status(ghost_email)
+		self.assertEqual(status["status"], "Merge Failed")
+		self.assertEqual(status["merge_status"], "Failed")
+		self.assertEqual(status["error"], "boom")
+
+	def test_convert_retry_returns_same_result(self):
+		"""
+		A retried conversion gets the first call's result instead of failing or minting new tokens,
+		and never the tokens themselves, which only the original (OTP-checked) call receives.
+		"""
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
+
+		ghost_email = create_ghost_session()["user"]
+		real_email = "retried_real@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=True)
+
+		first = convert_to_real_user(ghost_email, real_email)
+		retry = convert_to_real_user(ghost_email, real_email)
+
+		self.assertIn("access_token", first)
+		self.assertNotIn("access_token", retry)
+		self.assertNotIn("refresh_token", retry)
+		self.assertEqual(retry["user"], first["user"])
+		self.assertEqual(retry["merged"], first["merged"])
+		self.assertEqual(
+			frappe.db.count("OAuth Bearer Token", {"user": real_email, "status": "Active"}), 1
+		)
+
+	def test_conversion_lock_is_exclusive(self):
+		from ghost.locks import redis_lock
+
+		with redis_lock("conversion:locked_ghost@guest.local") as held:
+			self.assertTrue(held)
+			with redis_lock("conversion:locked_ghost@guest.local", blocking_timeout=0) as second:
+				self.assertFalse(second)
+
+		with redis_lock("conversion:locked_ghost@guest.local", blocking_timeout=0) as after_release:
+			self.assertTrue(after_release)
+
+	def test_session_rate_limit_token_bucket(self):
+		from ghost import rate_limiter
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.enable_session_rate_limit = 1
+		settings.session_ip_burst = 2
+		settings.session_ip_refill_per_hour = 1
+		settings.session_client_burst = 0
+		settings.session_global_burst = 0
+		settings.save()
+
+		frappe.cache().delete_value("ghost_bucket:test_endpoint:ip:203.0.113.7")
+		frappe.local.request = frappe._dict()
+		frappe.local.request_ip = "203.0.113.7"
+		try:
+			rate_limiter.check_rate_limit("test_endpoint")
+			rate_limiter.check_rate_limit("test_endpoint")
+			with self.assertRaises(frappe.TooManyRequestsError):
+				rate_limiter.check_rate_limit("test_endpoint")
+
+			# Another IP still has its own full bucket
+			frappe.local.request_ip = "203.0.113.8"
+			frappe.cache().delete_value("ghost_bucket:test_endpoint:ip:203.0.113.8")
+			rate_limiter.check_rate_limit("test_endpoint")
+		finally:
+			del frappe.local.request
+			frappe.local.request_ip = None
+			rate_limiter._rejected.clear()
+			settings.reload()
+			settings.enable_session_rate_limit = 0
+			settings.save()
+
+	def test_rate_limit_rejection_keeps_shared_buckets_open(self):
+		from ghost import rate_limiter
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.enable_session_rate_limit = 1
+		settings.session_ip_burst = 1
+		settings.session_ip_refill_per_hour = 1
+		settings.session_client_burst = 100
+		settings.session_client_refill_per_hour = 100
+		settings.session_global_burst = 100
+		settings.session_global_refill_per_hour = 100
+		settings.save()
+
+		for key in ("ip:203.0.113.9", "ip:203.0.113.10", "client:default", "global:all"):
+			frappe.cache().delete_value(f"ghost_bucket:shared_endpoint:{key}")
+		frappe.local.request = frappe._dict()
+		frappe.local.request_ip = "203.0.113.9"
+		try:
+			rate_limiter.check_rate_limit("shared_endpoint")
+			with self.assertRaises(frappe.TooManyRequestsError):
+				rate_limiter.check_rate_limit("shared_endpoint")
+
+			# Only the empty IP bucket is remembered by the worker
+			site = frappe.local.site
+			self.assertEqual(
+				{key for s, key in rate_limiter._rejected if s == site},
+				{"ghost_bucket:shared_endpoint:ip:203.0.113.9"},
+			)
+
+			frappe.local.request_ip = "203.0.113.10"
+			rate_limiter.check_rate_limit("shared_endpoint")
+		finally:
+			del frappe.local.request
+			frappe.local.request_ip = None
+			rate_limiter._rejected.clear()
+			settings.reload()
+			settings.enable_session_rate_limit = 0
+			settings.save()
+
+	def test_session_client_id_is_allow_listed(self):
+		"""
+		An unlisted client_id neither gets its own rate-limit bucket nor tokens for that client.
+		"""
+		from ghost import rate_limiter
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.enable_session_rate_limit = 1
+		settings.session_ip_burst = 100
+		settings.session_ip_refill_per_hour = 100
+		settings.session_client_burst = 1
+		settings.session_client_refill_per_hour = 1
+		settings.session_global_burst = 0
+		settings.session_client_ids = None
+		settings.save()
+
+		frappe.cache().delete_value(f"ghost_bucket:client_endpoint:client:{settings.client_id}")
+		frappe.cache().delete_value("ghost_bucket:client_endpoint:ip:203.0.113.11")
+		frappe.local.request = frappe._dict()
+		frappe.local.request_ip = "203.0.113.11"
+		try:
+			rate_limiter.check_rate_limit("client_endpoint", client_id="made_up_1")
+			with self.assertRaises(frappe.TooManyRequestsError):
+				rate_limiter.check_rate_limit("client_endpoint", client_id="made_up_2")
+		finally:
+			del frappe.local.request
+			frappe.local.request_ip = None
+			rate_limiter._rejected.clear()
+			settings.reload()
+			settings.enable_session_rate_limit = 0
+			settings.save()
+
+		tokens = create_ghost_session(client_id="made_up_client")
+		self.assertEqual(
+			frappe.db.get_value("OAuth Bearer Token", {"access_token": tokens["access_token"]}, "client"),
+			settings.client_id,
+		)
+
+	def test_metrics_exposition(self):
+		from ghost.metrics import instrument, render_prometheus, reset_metrics
+
+		@instrument("test_job", kind="job")
+		def job(fail=False):
+			frappe.db.sql("select 1")
+			if fail:
+				frappe.throw("nope")
+
+		reset_metrics()
+		job()
+		with self.assertRaises(frappe.ValidationError):
+			job(fail=True)
+
+		text = render_prometheus()
+		self.assertIn('ghost_calls_total{kind="job",name="test_job",outcome="success"} 1', text)
+		self.assertIn('ghost_calls_total{kind="job",name="test_job",outcome="rejected"} 1', text)
+		self.assertIn('ghost_call_duration_seconds_count{kind="job",name="test_job"} 2', text)
+		self.assertIn('ghost_db_queries_total{kind="job",name="test_job"} 2', text)
+		reset_metrics()
+
+	def test_profiler_keeps_slowest(self):
+		import marshal
+		import time
+
+		from ghost import profiler
+		from ghost.metrics import instrument
+
+		frappe.db.set_single_value("Ghost Settings", {"profile_sample_rate": 1, "profile_keep_slowest": 2})
+		frappe.clear_cache(doctype="Ghost Settings")
+		profiler.clear_config()
+		profiler.clear_profiles()
+
+		@instrument("test_profiled", kind="job")
+		def job(delay):
+			frappe.db.sql("select 1")
+			time.sleep(delay)
+
+		try:
+			for delay in (0.03, 0.01, 0.02):
+				job(delay)
+			profiles = profiler.get_profiles()
+		finally:
+			frappe.db.set_single_value("Ghost Settings", "profile_sample_rate", 0)
+			frappe.clear_cache(doctype="Ghost Settings")
+			profiler.clear_config()
+
+		self.assertEqual(len(profiles), 2)
+		self.assertGreater(profiles[0]["seconds"], profiles[1]["seconds"])
+		self.assertGreaterEqual(profiles[1]["seconds"], 0.02)
+
+		kept = profiler.get_profile(profiles[0]["id"])
+		self.assertEqual(kept["statements"][0]["query"], "select 1")
+		self.assertTrue(marshal.loads(kept["pstats"]))
+		profiler.clear_profiles()
+
+	def test_warm_worker_runs_once_per_site(self):
+		from unittest.mock import patch
+
+		from ghost import warmup
+
+		warmup._warmed.discard(frappe.local.site)
+		warmup._failed.pop(frappe.local.site, None)
+
+		# A failed warm-up is not retried on every request, only after RETRY_INTERVAL
+		with patch("ghost.warmup._warm_up", side_effect=ImportError("no sender")) as failing:
+			warmup.warm_worker()
+			warmup.warm_worker()
+		failing.assert_called_once()
+		self.assertNotIn(frappe.local.site, warmup._warmed)
+
+		warmup._failed[frappe.local.site] -= warmup.RETRY_INTERVAL
+		with patch("ghost.warmup.warm_up", return_value=True) as warm_up:
+			warmup.warm_worker()
+			warmup.warm_worker()
+		warm_up.assert_called_once()
+		self.assertIn(frappe.local.site, warmup._warmed)
+
+		with patch("frappe.get_meta", wraps=frappe.get_meta) as get_meta:
+			self.assertTrue(warmup.warm_up())
+		self.assertTrue(set(warmup.WARM_DOCTYPES) <= {c.args[0] for c in get_meta.call_args_list})
+
+	def test_funnel_counts_and_flush(self):
+		from frappe.utils import today
+
+		from ghost import funnel
+		from ghost.funnel import flush_funnel, get_counts
+
+		before = get_counts(today())["sessions_created"]
+		create_ghost_session()
+		self.assertEqual(get_counts(today())["sessions_created"], before + 1)
+
+		# Nothing is counted for a rolled back transaction
+		funnel.count("session_created")
+		frappe.db.rollback()
+		self.assertEqual(get_counts(today())["sessions_created"], before + 1)
+
+		self.assertGreaterEqual(flush_funnel(), 1)
+		flush_funnel()
+		self.assertEqual(
+			frappe.db.get_value("Ghost Funnel Daily", {"date": today()}, "sessions_created"), before + 1
+		)
+
+		# Lost Redis counters never lower the persisted totals
+		frappe.cache().delete_value(f"{funnel.FUNNEL_KEY}:{today()}")
+		create_ghost_session()
+		flush_funnel()
+		self.assertEqual(
+			frappe.db.get_value("Ghost Funnel Daily", {"date": today()}, "sessions_created"), before + 1
+		)
+
 	def test_convert_with_otp_enforced(self):
 		"""
 		Test Strict OTP Enforcement for conversion.
 		"""
-		from ghost.api.ghost import create_ghost_session, convert_to_real_user
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
 		from ghost.api.otp import send_otp
 
 		# 1. Enable Strict Mode
@@ -238,11 +742,39 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		self.assertTrue(frappe.db.exists("User", real_email), "Real user should serve")
 		print(f"\n[Success] Verified Strict OTP flow for {real_email}")
 
+	def test_ghost_user_inserted_lean(self):
+		"""
+		A ghost gets only its User and role rows, with the values the User controller
+		would have set; the controller runs once the ghost is renamed into a real account.
+		"""
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Rename"
+		settings.async_conversion = 0
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+		ghost = frappe.get_doc("User", ghost_email)
+
+		self.assertEqual(ghost.full_name, "Ghost User")
+		self.assertEqual(ghost.user_type, "Website User")
+		self.assertTrue(ghost.time_zone)
+		self.assertEqual([r.role for r in ghost.roles], [get_ghost_role(settings)])
+		self.assertFalse(frappe.db.exists("Notification Settings", ghost_email))
+
+		real_email = "lean_ghost@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=1)
+
+		convert_to_real_user(ghost_email, real_email, first_name="Lean")
+
+		self.assertEqual(frappe.db.get_value("User", real_email, "full_name"), "Lean User")
+		self.assertTrue(frappe.db.exists("Notification Settings", real_email))
+
 	def test_role_transition(self):
 		"""
 		Test that Roles are correctly swapped after conversion.
 		"""
-		from ghost.api.ghost import create_ghost_session, convert_to_real_user
+		from ghost.api.ghost import convert_to_real_user, create_ghost_session
 
 		# 1. Config
 		target_role = "Blogger" 
@@ -272,3 +804,113 @@ class TestFrappeIdentityAPI(unittest.TestCase):
 		self.assertIn(target_role, roles, f"User should have {target_role}")
 		print(f"\n[Success] Verified Role Transition: Ghost -> {target_role}")
 
+
+
+class TestConversionTransaction(FrappeTestCase):
+	"""Conversion must commit exactly once and stay within a fixed query budget."""
+
+	# Async mode: OTP off, role swap, profile update, token revocation and issuance; no data merge
+	QUERY_BUDGET = 40
+	# Rename mode on top of that: rename_doc's own reads and writes besides the per-link UPDATEs
+	RENAME_OVERHEAD = 40
+	# Measured costs vary by a few cache reads between runs
+	SLACK = 5
+
+	def setUp(self):
+		if not frappe.db.exists("Role", "Ghost"):
+			frappe.get_doc({"doctype": "Role", "role_name": "Ghost"}).insert(ignore_permissions=True)
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.enable_ghost_feature = 1
+		settings.ghost_role = "Ghost"
+		settings.verify_otp_on_conversion = 0
+		settings.default_user_role = None
+		settings.invalidate_ghost_tokens_on_conversion = 1
+		settings.conversion_mode = "Targeted"
+		settings.conversion_doctypes = "ToDo"
+		settings.async_conversion = 0
+		settings.save()
+
+		self.real_email = "single_txn@example.com"
+		if frappe.db.exists("User", self.real_email):
+			frappe.delete_doc("User", self.real_email, force=True)
+
+	def tearDown(self):
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Rename"
+		settings.async_conversion = 0
+		settings.save()
+
+	def test_single_commit(self):
+		ghost_email = create_ghost_session()["user"]
+
+		with patch.object(frappe.db, "commit", wraps=frappe.db.commit) as commit:
+			result = convert_to_real_user(ghost_email, self.real_email, "Single", "Commit")
+
+		self.assertEqual(commit.call_count, 1)
+		self.assertIn("access_token", result)
+		self.assertFalse(frappe.db.exists("User", ghost_email))
+
+		roles = frappe.get_all("Has Role", filters={"parent": self.real_email}, pluck="role")
+		self.assertNotIn("Ghost", roles)
+		self.assertEqual(frappe.db.get_value("User", self.real_email, "full_name"), "Single Commit")
+
+	def test_query_budget(self):
+		settings = frappe.get_single("Ghost Settings")
+		settings.async_conversion = 1
+		settings.save()
+
+		ghost_email = create_ghost_session()["user"]
+		frappe.get_cached_doc("Ghost Settings")
+
+		with self.assertQueryCount(self.QUERY_BUDGET):
+			convert_to_real_user(ghost_email, self.real_email)
+
+	def test_query_budget_sync_targeted(self):
+		"""
+		Sync Targeted conversion costs the async path, at most a COUNT and an UPDATE per
+		mapped column, and deleting the ghost User; nothing else.
+		"""
+		from ghost.conversion import iter_link_columns
+		from ghost.metrics import count_queries
+
+		columns = list(iter_link_columns())
+
+		# What deleting a ghost User costs on this site
+		spare = create_ghost_session()["user"]
+		with count_queries() as delete_cost:
+			frappe.delete_doc("User", spare, ignore_permissions=True, force=1)
+
+		ghost_email = create_ghost_session()["user"]
+		frappe.get_cached_doc("Ghost Settings")
+
+		with self.assertQueryCount(self.QUERY_BUDGET + 2 * len(columns) + delete_cost["queries"] + self.SLACK):
+			convert_to_real_user(ghost_email, self.real_email)
+
+	def test_query_budget_sync_rename(self):
+		"""Sync Rename conversion costs the async path plus rename_doc, which scales with the User links."""
+		from frappe.model.dynamic_links import get_dynamic_link_map
+		from frappe.model.rename_doc import get_link_fields
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.conversion_mode = "Rename"
+		settings.save()
+
+		links = len(get_link_fields("User")) + sum(len(d) for d in get_dynamic_link_map().values())
+
+		ghost_email = create_ghost_session()["user"]
+		frappe.get_cached_doc("Ghost Settings")
+
+		with self.assertQueryCount(self.QUERY_BUDGET + self.RENAME_OVERHEAD + 2 * links):
+			convert_to_real_user(ghost_email, self.real_email)
+
+	def test_rollback_on_failure(self):
+		ghost_email = create_ghost_session()["user"]
+
+		with patch("ghost.api.ghost.finalize_real_user", side_effect=frappe.ValidationError):
+			with self.assertRaises(frappe.ValidationError):
+				convert_to_real_user(ghost_email, self.real_email)
+
+		self.assertTrue(frappe.db.exists("User", ghost_email), "Ghost must survive a failed conversion")
+		self.assertEqual(frappe.db.get_value("Ghost Identity", ghost_email, "status"), "Active")
+		self.assertFalse(frappe.db.exists("User", self.real_email))
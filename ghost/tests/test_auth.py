@@ -61,6 +61,25 @@ class TestGhostAuth(unittest.TestCase):
 		self.assertEqual(user.last_name, "Guy")
 		self.assertIn("Customer", [r.role for r in user.roles], "Should have default role from settings")
 
+	def test_signup_without_default_role_matches_conversion(self):
+		"""Signup and conversion fall back to the same role when none is configured."""
+		from ghost.api.auth import create_new_user
+		from ghost.ghost_user import get_user_role
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.default_user_role = None
+		settings.save()
+
+		email = "no_role_signup@example.com"
+		if frappe.db.exists("User", email):
+			frappe.delete_doc("User", email, force=True)
+
+		create_new_user(email, settings=settings)
+		roles = [r.role for r in frappe.get_doc("User", email).roles]
+		self.assertNotIn("Customer", roles)
+		if get_user_role(settings):
+			self.assertIn(get_user_role(settings), roles)
+
 	def test_ghost_conversion_flow(self):
 		"""
 		Test Scenario: Ghost User -> Login -> Converted to Real User
@@ -93,6 +112,25 @@ class TestGhostAuth(unittest.TestCase):
 		# Real should exist
 		self.assertTrue(frappe.db.exists("User", real_email))
 
+	def test_ghost_conversion_issues_single_token(self):
+		"""
+		Login as a ghost reuses the tokens minted by the conversion.
+		"""
+		ghost_email = create_ghost_session()["user"]
+		frappe.session.user = ghost_email
+
+		real_email = "single_token_auth@example.com"
+		if frappe.db.exists("User", real_email):
+			frappe.delete_doc("User", real_email, force=True, ignore_permissions=True)
+
+		send_otp(email=real_email, purpose="Conversion")
+		otp_code = frappe.db.get_value("OTP", {"email": real_email}, "otp_code")
+
+		response = login(otp=otp_code, email=real_email)
+
+		self.assertIn("access_token", response)
+		self.assertEqual(frappe.db.count("OAuth Bearer Token", {"user": real_email}), 1)
+
 	def test_client_id_token_generation(self):
 		"""
 		Test Scenario: Login with client_id -> Returns Access Token
@@ -134,5 +172,263 @@ class TestGhostAuth(unittest.TestCase):
 		# We don't strictly enforce client check here as naming series might differ, but token creation is success.
 		# self.assertEqual(token_doc.client, client_id)
 
+	def test_client_policy_cache(self):
+		"""
+		Per-client token policy is applied, and the worker cache forgets a client once it is deleted.
+		"""
+		from ghost.api.auth import generate_oauth_tokens
+		from ghost.install import create_oauth_client_fields
+
+		create_oauth_client_fields()
+
+		c = frappe.new_doc("OAuth Client")
+		c.app_name = "Policy App"
+		c.skat = "1"
+		c.default_redirect_uri = "http://localhost"
+		c.redirect_uris = "http://localhost"
+		c.ghost_access_token_expiry_seconds = 600
+		c.save(ignore_permissions=True)
+
+		tokens = generate_oauth_tokens("Administrator", client_id=c.name)
+		self.assertEqual(tokens["expires_in"], 600)
+
+		c.ghost_access_token_expiry_seconds = 900
+		c.save(ignore_permissions=True)
+		tokens = generate_oauth_tokens("Administrator", client_id=c.name)
+		self.assertEqual(tokens["expires_in"], 900)
+
+		# Same floor as Ghost Settings
+		c.ghost_access_token_expiry_seconds = 120
+		with self.assertRaises(frappe.ValidationError):
+			c.save(ignore_permissions=True)
+		c.reload()
+
+		frappe.db.delete("OAuth Bearer Token", {"client": c.name})
+		frappe.delete_doc("OAuth Client", c.name, ignore_permissions=True)
+		with self.assertRaises(frappe.ValidationError):
+			generate_oauth_tokens("Administrator", client_id=c.name)
+
+	def test_token_cache_purged_on_refresh(self):
+		"""
+		Issued tokens validate from the cache, and a refresh revokes the old one immediately.
+		"""
+		from ghost.api.auth import generate_oauth_tokens, refresh_bearer_token
+		from ghost.tokens import get_token_info, token_digest
+
+		c = frappe.new_doc("OAuth Client")
+		c.app_name = "Token Cache App"
+		c.skat = "1"
+		c.default_redirect_uri = "http://localhost"
+		c.redirect_uris = "http://localhost"
+		c.save(ignore_permissions=True)
+
+		tokens = generate_oauth_tokens("Administrator", client_id=c.name)
+		key = f"ghost_token:{token_digest(tokens['access_token'])}"
+		self.assertEqual(frappe.cache().get_value(key, expires=True)["user"], "Administrator")
+		self.assertEqual(get_token_info(tokens["access_token"])["user"], "Administrator")
+
+		refresh_bearer_token(tokens["refresh_token"])
+		self.assertIsNone(frappe.cache().get_value(key, expires=True))
+		self.assertIsNone(get_token_info(tokens["access_token"]))
+
+	def test_introspect_token(self):
+		"""
+		Introspection reports cached tokens as active and is limited to the introspector role.
+		"""
+		from ghost.api.auth import generate_oauth_tokens, introspect_token
+		from ghost.install import create_introspection_role
+		from ghost.tokens import INTROSPECTION_ROLE
+
+		create_introspection_role()
+		self.assertTrue(frappe.db.exists("Role", INTROSPECTION_ROLE))
+
+		c = frappe.new_doc("OAuth Client")
+		c.app_name = "Introspection App"
+		c.skat = "1"
+		c.default_redirect_uri = "http://localhost"
+		c.redirect_uris = "http://localhost"
+		c.save(ignore_permissions=True)
+
+		tokens = generate_oauth_tokens("Administrator", client_id=c.name)
+		info = introspect_token(tokens["access_token"])
+		self.assertTrue(info["active"])
+		self.assertEqual(info["username"], "Administrator")
+		self.assertEqual(info["client_id"], c.name)
+		self.assertEqual(introspect_token("not-a-token"), {"active": False})
+
+	def test_bulk_revoke_tokens(self):
+		"""
+		Bulk revocation only touches matching tokens, reports counts and purges the token cache.
+		"""
+		from ghost.api.auth import generate_oauth_tokens, revoke_tokens
+		from ghost.tokens import get_token_info
+
+		c = frappe.new_doc("OAuth Client")
+		c.app_name = "Bulk Revoke App"
+		c.skat = "1"
+		c.default_redirect_uri = "http://localhost"
+		c.redirect_uris = "http://localhost"
+		c.save(ignore_permissions=True)
+
+		revoked = generate_oauth_tokens("Administrator", client_id=c.name)
+		kept = generate_oauth_tokens("Guest", client_id=c.name)
+
+		with self.assertRaises(frappe.ValidationError):
+			revoke_tokens()
+
+		result = revoke_tokens(client=c.name, users='["Administrator"]')
+
+		self.assertEqual(result["revoked"], 1)
+		self.assertEqual(result["clients"], {c.name: 1})
+		self.assertIsNone(get_token_info(revoked["access_token"]))
+		self.assertEqual(get_token_info(kept["access_token"])["user"], "Guest")
+
+	def test_token_only_login_skips_session(self):
+		"""
+		Token-only mode returns bearer tokens and never calls LoginManager.login_as.
+		"""
+		from unittest.mock import patch
+
+		client_id = "test_token_only_client"
+		if not frappe.db.exists("OAuth Client", client_id):
+			c = frappe.new_doc("OAuth Client")
+			c.client_id = client_id
+			c.app_name = "Token Only App"
+			c.skat = "1"
+			c.default_redirect_uri = "http://localhost"
+			c.redirect_uris = "http://localhost"
+			c.save(ignore_permissions=True)
+
+		settings = frappe.get_single("Ghost Settings")
+		previous_client = settings.client_id
+		settings.client_id = client_id
+		settings.token_only_login = 1
+		settings.save()
+
+		email = "token_only_user@example.com"
+		send_otp(email=email, purpose="Conversion")
+		otp_code = frappe.db.get_value("OTP", {"email": email, "status": "Valid"}, "otp_code")
+
+		frappe.session.user = "Guest"
+		frappe.local.request = frappe._dict()
+		try:
+			with patch("frappe.auth.LoginManager.login_as") as login_as:
+				response = login(otp=otp_code, email=email)
+		finally:
+			del frappe.local.request
+			frappe.set_user("Administrator")
+			settings.reload()
+			settings.token_only_login = 0
+			settings.client_id = previous_client
+			settings.save()
+
+		login_as.assert_not_called()
+		self.assertIn("access_token", response)
+
+	def test_mobile_login_normalizes_number(self):
+		"""
+		A number typed in local format resolves the user stored in E.164.
+		"""
+		from ghost.ghost.doctype.otp.otp import generate
+		from ghost.phone import normalize_phone
+
+		self.assertEqual(normalize_phone("(415) 555-0123", region="US"), "+14155550123")
+		self.assertEqual(normalize_phone("+1 415 555 0123"), "+14155550123")
+
+		settings = frappe.get_single("Ghost Settings")
+		settings.default_phone_region = "us"
+		settings.save()
+		self.assertEqual(settings.default_phone_region, "US")
+
+		email = "mobile_user@example.com"
+		if frappe.db.exists("User", email):
+			frappe.delete_doc("User", email, force=True)
+		user = frappe.get_doc(
+			{"doctype": "User", "email": email, "first_name": "Mobile", "mobile_no": "415-555-0123"}
+		).insert(ignore_permissions=True)
+		self.assertEqual(user.mobile_no, "+14155550123")
+
+		otp_code = generate(phone="4155550123", purpose="Conversion", send=False)["otp_code"]
+
+		frappe.session.user = "Guest"
+		try:
+			response = login(otp=otp_code, mobile_no="(415) 555-0123")
+		finally:
+			settings.reload()
+			settings.default_phone_region = None
+			settings.save()
+
+		self.assertEqual(response["user"], email)
+
+	def test_region_change_renormalizes_stored_numbers(self):
+		"""
+		Numbers stored before a Default Phone Region was set are re-read once it is.
+		"""
+		from unittest.mock import patch
+
+		from ghost.phone import normalize_user_mobiles
+
+		email = "local_mobile_user@example.com"
+		if frappe.db.exists("User", email):
+			frappe.delete_doc("User", email, force=True)
+		frappe.get_doc({"doctype": "User", "email": email, "first_name": "Local"}).insert(
+			ignore_permissions=True
+		)
+		# As saved before any region was configured
+		frappe.db.set_value("User", email, "mobile_no", "4155550199", update_modified=False)
+
+		settings = frappe.get_single("Ghost Settings")
+		with patch("frappe.enqueue") as enqueue:
+			settings.default_phone_region = "US"
+			settings.save()
+			settings.save()
+		enqueue.assert_called_once()
+		self.assertEqual(enqueue.call_args.kwargs["region"], "US")
+
+		try:
+			self.assertGreaterEqual(normalize_user_mobiles(region="US"), 1)
+			self.assertEqual(frappe.db.get_value("User", email, "mobile_no"), "+14155550199")
+		finally:
+			settings.reload()
+			settings.default_phone_region = None
+			settings.save()
+
+	def test_replica_reads_fall_back_and_restore_primary(self):
+		"""
+		Reads stay on the primary until a replica is configured, and the primary is always restored.
+		"""
+		from unittest.mock import MagicMock, patch
+
+		from ghost.replica import close_replica, replica
+
+		primary = frappe.local.db
+		frappe.db.set_single_value("Ghost Settings", "use_read_replica", 1)
+		frappe.clear_cache(doctype="Ghost Settings")
+		try:
+			with replica():
+				self.assertIs(frappe.local.db, primary)
+
+			replica_db = MagicMock()
+			conf = frappe._dict(frappe.local.conf, read_from_replica=1, replica_host="replica.local")
+			with patch.object(frappe.local, "conf", conf), patch("frappe.database.get_db", return_value=replica_db) as get_db:
+				with self.assertRaises(ZeroDivisionError):
+					with replica():
+						self.assertIs(frappe.local.db, replica_db)
+						with replica():
+							self.assertIs(frappe.local.db, replica_db)
+						1 / 0
+				self.assertIs(frappe.local.db, primary)
+
+				with replica():
+					self.assertIs(frappe.local.db, replica_db)
+				close_replica()
+
+			get_db.assert_called_once()
+			replica_db.close.assert_called_once()
+		finally:
+			frappe.local.db = primary
+			frappe.db.set_single_value("Ghost Settings", "use_read_replica", 0)
+			frappe.clear_cache(doctype="Ghost Settings")
+
 	def tearDown(self):
 		frappe.set_user("Administrator")
@@ -54,6 +54,98 @@ class TestFrappeIdentityOTP(unittest.TestCase):
 		# 4. Cleanup
 		frappe.delete_doc("OTP", otp_name)
 
+	def test_verify_consumes_otp_once(self):
+		email = "consume_once@guest.local"
+		result = generate(email=email, purpose="Login", send=False)
+
+		self.assertTrue(verify(otp_code=result["otp_code"], email=email, purpose="Login")["valid"])
+		self.assertEqual(frappe.db.get_value("OTP", result["name"], "status"), "Expired")
+
+		with self.assertRaises(frappe.ValidationError):
+			verify(otp_code=result["otp_code"], email=email, purpose="Login")
+
+	def test_verify_rejects_expired_otp(self):
+		from frappe.utils import add_to_date, now_datetime
+
+		email = "expired_verify@guest.local"
+		result = generate(email=email, purpose="Login", send=False)
+		frappe.db.set_value("OTP", result["name"], "expiry", add_to_date(now_datetime(), minutes=-1))
+
+		with self.assertRaises(frappe.ValidationError):
+			verify(otp_code=result["otp_code"], email=email, purpose="Login")
+
+	def test_capture_mode_records_stored_otp(self):
+		from ghost.api.otp import get_captured_otp
+
+		email = "capture_mode@guest.local"
+		frappe.db.set_single_value("Ghost Settings", "otp_capture_mode", 1)
+		frappe.clear_cache(doctype="Ghost Settings")
+		try:
+			result = generate(email=email, purpose="Login")
+			captured = get_captured_otp(email=email)
+		finally:
+			frappe.db.set_single_value("Ghost Settings", "otp_capture_mode", 0)
+			frappe.clear_cache(doctype="Ghost Settings")
+
+		# The full path ran: a stored OTP, delivered to the capture sink only
+		self.assertTrue(result["name"])
+		self.assertEqual(result["send_results"][0]["method"], "capture")
+		self.assertEqual(captured["otp_code"], result["otp_code"])
+		self.assertTrue(verify(otp_code=captured["otp_code"], email=email, purpose="Login")["valid"])
+
+	def test_expire_otps_job_log_and_overlap(self):
+		from frappe.utils import add_to_date, now_datetime
+
+		from ghost.locks import redis_lock
+		from ghost.tasks import expire_otps
+
+		result = generate(email="job_log_otp@guest.local", purpose="Login", send=False)
+		frappe.db.set_value("OTP", result["name"], "expiry", add_to_date(now_datetime(), minutes=-1))
+
+		# A run still holding the lock makes the next tick skip
+		with redis_lock("job:expire_otps"):
+			self.assertEqual(expire_otps(), {"skipped": True})
+		self.assertEqual(frappe.db.get_value("OTP", result["name"], "status"), "Valid")
+
+		self.assertGreaterEqual(expire_otps()["expired_count"], 1)
+		self.assertEqual(frappe.db.get_value("OTP", result["name"], "status"), "Expired")
+
+		logs = frappe.get_all(
+			"Ghost Job Log",
+			filters={"job": "expire_otps"},
+			fields=["status", "rows_processed", "batches"],
+			order_by="creation desc",
+			limit=2,
+		)
+		self.assertEqual([log.status for log in logs], ["Success", "Skipped"])
+		self.assertGreaterEqual(logs[0].rows_processed, 1)
+		self.assertGreaterEqual(logs[0].batches, 1)
+
+	def test_otp_spans_nest_in_one_trace(self):
+		from unittest.mock import patch
+
+		from ghost import tracing
+
+		email = "traced_otp@guest.local"
+		frappe.db.set_single_value("Ghost Settings", "enable_tracing", 1)
+		frappe.clear_cache(doctype="Ghost Settings")
+		tracing.clear_config()
+		try:
+			with patch("ghost.tracing.export") as export:
+				with tracing.span("test.root"):
+					result = generate(email=email, purpose="Login", send=False)
+					verify(otp_code=result["otp_code"], email=email, purpose="Login")
+		finally:
+			frappe.db.set_single_value("Ghost Settings", "enable_tracing", 0)
+			frappe.clear_cache(doctype="Ghost Settings")
+			tracing.clear_config()
+
+		export.assert_called_once()
+		spans = {s["name"]: s for s in export.call_args[0][0]}
+		self.assertEqual(set(spans), {"test.root", "otp.generate", "otp.verify"})
+		self.assertEqual(spans["otp.verify"]["parent_id"], spans["test.root"]["span_id"])
+		self.assertEqual(len({s["trace_id"] for s in spans.values()}), 1)
+
 	def tearDown(self):
 		pass
 
@@ -0,0 +1,150 @@
+"""
+Introspection cache for Ghost-issued OAuth bearer tokens.
+
+Entries are keyed by a SHA-256 digest of the access token, so the token itself
+never reaches Redis, and hold the user, scopes and expiry. Their TTL is capped
+at the token's remaining life. Every revocation path purges the affected
+entries, so a revoked token stops introspecting as active.
+
+Frappe authenticates `Authorization: Bearer` requests itself (frappe.auth.validate_oauth
+runs before any app hook), so this cache does not remove that per-request lookup.
+It serves `ghost.api.auth.introspect_token`, for gateways and services that
+validate Ghost tokens without a database round trip. Those authenticate as a
+user holding INTROSPECTION_ROLE (e.g. with its API key) rather than as a System Manager.
+"""
+
+import hashlib
+from functools import partial
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, now_datetime
+
+TOKEN_CACHE_PREFIX = "ghost_token"
+# The only role allowed to introspect tokens (created on install)
+INTROSPECTION_ROLE = "Ghost Token Introspector"
+REVOKE_CHUNK_SIZE = 1000
+
+
+def token_digest(access_token):
+	return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def cache_token(access_token, user, scopes, expiration_time, client=None):
+	ttl = int((get_datetime(expiration_time) - now_datetime()).total_seconds())
+	if ttl <= 0:
+		return
+
+	frappe.cache().set_value(
+		_cache_key(access_token),
+		{"user": user, "scopes": scopes, "client": client, "expiration_time": str(expiration_time)},
+		expires_in_sec=ttl,
+	)
+
+
+def get_token_info(access_token):
+	"""User, scopes, client and expiry of an active token, or None. Served from Redis when cached."""
+	if not access_token:
+		return None
+
+	info = frappe.cache().get_value(_cache_key(access_token), expires=True)
+	if info:
+		return info
+
+	token = frappe.db.get_value(
+		"OAuth Bearer Token",
+		{"access_token": access_token, "status": "Active"},
+		["user", "scopes", "client", "expiration_time"],
+		as_dict=True,
+	)
+	if not token or get_datetime(token.expiration_time) <= now_datetime():
+		return None
+
+	cache_token(access_token, token.user, token.scopes, token.expiration_time, client=token.client)
+	return {
+		"user": token.user,
+		"scopes": token.scopes,
+		"client": token.client,
+		"expiration_time": str(token.expiration_time),
+	}
+
+
+def purge_tokens(access_tokens):
+	"""
+	Drop cached entries for the given access tokens (call alongside any revocation).
+	They are dropped again once the revocation commits, since a concurrent lookup can
+	still read the Active row and cache it until then.
+	"""
+	keys = [_cache_key(t) for t in access_tokens if t]
+	if keys:
+		frappe.cache().delete_value(keys)
+		frappe.db.after_commit.add(partial(frappe.cache().delete_value, keys))
+
+
+def purge_token_cache(doc, method=None):
+	"""OAuth Bearer Token on_update / on_trash hook: covers revocations done outside Ghost."""
+	purge_tokens([doc.access_token])
+
+
+def _cache_key(access_token):
+	return f"{TOKEN_CACHE_PREFIX}:{token_digest(access_token)}"
+
+
+def revoke_tokens(
+	client=None, scope=None, users=None, issued_after=None, issued_before=None, chunk_size=REVOKE_CHUNK_SIZE
+):
+	"""
+	Revoke every active token matching all the given filters, in chunked set-based updates
+	committed one chunk at a time. Cached entries are purged with each chunk.
+	Returns {"revoked": total, "chunks": n, "clients": {client: count}}.
+	"""
+	conditions, values = ["status = 'Active'"], []
+	if client:
+		conditions.append("client = %s")
+		values.append(client)
+	if scope:
+		# scopes is a space separated list
+		conditions.append("CONCAT(' ', scopes, ' ') LIKE %s")
+		values.append(f"% {scope} %")
+	if users:
+		conditions.append("user IN %s")
+		values.append(tuple(users))
+	if issued_after:
+		conditions.append("creation >= %s")
+		values.append(get_datetime(issued_after))
+	if issued_before:
+		conditions.append("creation < %s")
+		values.append(get_datetime(issued_before))
+
+	if len(conditions) == 1:
+		frappe.throw(_("Pass at least one filter: client, scope, users or an issue window."))
+
+	where = " AND ".join(conditions)
+	result = {"revoked": 0, "chunks": 0, "clients": {}}
+
+	while True:
+		rows = frappe.db.sql(
+			f"""
+			SELECT name, access_token, client FROM `tabOAuth Bearer Token`
+			WHERE {where} LIMIT {int(chunk_size)}
+		""",
+			values,
+			as_dict=True,
+		)
+		if not rows:
+			break
+
+		frappe.db.sql(
+			"UPDATE `tabOAuth Bearer Token` SET status = 'Revoked' WHERE name IN %s AND status = 'Active'",
+			(tuple(r.name for r in rows),),
+		)
+		frappe.db.commit()
+		purge_tokens([r.access_token for r in rows])
+
+		result["revoked"] += len(rows)
+		result["chunks"] += 1
+		for r in rows:
+			result["clients"][r.client] = result["clients"].get(r.client, 0) + 1
+
+	frappe.logger().info(f"Revoked {result['revoked']} OAuth tokens ({where}, {values})")
+	return result
@@ -0,0 +1,186 @@
+"""
+Lightweight tracing spans for the session, OTP and conversion flows.
+
+Spans nest per request (or job) through `frappe.local` and continue an incoming
+W3C `traceparent` header when there is one. A finished trace is handed to the
+exporter picked in Ghost Settings > Tracing:
+
+- JSON Lines: one span per line in `<site>/logs/ghost-traces.jsonl`
+- OpenTelemetry: spans replayed through the `opentelemetry` API, so they follow the
+  site's OpenTelemetry SDK setup (falls back to JSON Lines when it is not installed)
+
+Apps can plug in their own exporter with a `ghost_trace_exporter` hook pointing to
+a callable that takes the list of finished spans.
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import frappe
+
+CONFIG_TTL = 30
+TRACE_FILE = "ghost-traces.jsonl"
+
+# site -> (loaded at, exporter name or None when tracing is off)
+_config = {}
+_file_lock = threading.Lock()
+
+
+@contextmanager
+def span(name, **attributes):
+	"""Time the block as a child of the current span. Yields the span dict (None when tracing is off)."""
+	exporter = get_exporter_name()
+	if not exporter:
+		yield None
+		return
+
+	trace = getattr(frappe.local, "ghost_trace", None)
+	if not trace:
+		trace = frappe.local.ghost_trace = _new_trace()
+
+	current = {
+		"trace_id": trace["trace_id"],
+		"span_id": secrets.token_hex(8),
+		"parent_id": trace["stack"][-1]["span_id"] if trace["stack"] else trace["remote_parent_id"],
+		"name": name,
+		"start_ns": time.time_ns(),
+		"status": "ok",
+		"attributes": {k: v for k, v in attributes.items() if v is not None},
+	}
+	trace["stack"].append(current)
+	try:
+		yield current
+	except Exception as e:
+		current["status"] = "error"
+		current["attributes"]["error"] = f"{type(e).__name__}: {e}"[:500]
+		raise
+	finally:
+		current["end_ns"] = time.time_ns()
+		current["duration_ms"] = round((current["end_ns"] - current["start_ns"]) / 1e6, 3)
+		trace["stack"].pop()
+		trace["spans"].append(current)
+
+		# Root span closed: the trace is complete
+		if not trace["stack"]:
+			frappe.local.ghost_trace = None
+			export(trace["spans"], exporter)
+
+
+def traced(name):
+	"""Decorator form of `span`"""
+
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			with span(name):
+				return fn(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+def set_attribute(key, value):
+	"""Annotate the innermost open span"""
+	trace = getattr(frappe.local, "ghost_trace", None)
+	if trace and trace["stack"] and value is not None:
+		trace["stack"][-1]["attributes"][key] = value
+
+
+def export(spans, exporter=None):
+	"""Tracing must never break the request it observes."""
+	try:
+		custom = frappe.get_hooks("ghost_trace_exporter")
+		if custom:
+			frappe.get_attr(custom[-1])(spans)
+		elif exporter == "OpenTelemetry" and _otel_available():
+			export_opentelemetry(spans)
+		else:
+			export_json_lines(spans)
+	except Exception:
+		frappe.logger().warning("Ghost tracing: failed to export spans", exc_info=True)
+
+
+def export_json_lines(spans):
+	path = frappe.get_site_path("logs", TRACE_FILE)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	lines = "".join(json.dumps(s, default=str, separators=(",", ":")) + "\n" for s in spans)
+	with _file_lock, open(path, "a") as f:
+		f.write(lines)
+
+
+def export_opentelemetry(spans):
+	from opentelemetry import trace as otel_trace
+	from opentelemetry.trace import Status, StatusCode
+
+	tracer = otel_trace.get_tracer("ghost")
+	started = {}
+
+	# Parents start before their children
+	for s in sorted(spans, key=lambda s: s["start_ns"]):
+		parent = started.get(s["parent_id"])
+		context = otel_trace.set_span_in_context(parent) if parent else None
+		otel_span = tracer.start_span(s["name"], context=context, start_time=s["start_ns"])
+		for key, value in s["attributes"].items():
+			otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+		otel_span.set_attribute("ghost.trace_id", s["trace_id"])
+		if s["status"] == "error":
+			otel_span.set_status(Status(StatusCode.ERROR))
+		started[s["span_id"]] = otel_span
+
+	for s in spans:
+		started[s["span_id"]].end(end_time=s["end_ns"])
+
+
+def get_exporter_name():
+	"""Exporter from a per-worker settings snapshot, None when tracing is off."""
+	site = getattr(frappe.local, "site", None)
+	if not site:
+		return None
+
+	cached = _config.get(site)
+	if cached and time.monotonic() - cached[0] < CONFIG_TTL:
+		return cached[1]
+
+	settings = frappe.get_cached_doc("Ghost Settings")
+	exporter = (settings.trace_exporter or "JSON Lines") if settings.enable_tracing else None
+	_config[site] = (time.monotonic(), exporter)
+	return exporter
+
+
+def clear_config():
+	_config.pop(frappe.local.site, None)
+
+
+def _new_trace():
+	trace_id, remote_parent_id = _incoming_traceparent()
+	return {
+		"trace_id": trace_id or secrets.token_hex(16),
+		"remote_parent_id": remote_parent_id,
+		"stack": [],
+		"spans": [],
+	}
+
+
+def _incoming_traceparent():
+	"""(trace id, parent span id) from a W3C traceparent header: version-traceid-spanid-flags"""
+	if not getattr(frappe.local, "request", None):
+		return None, None
+
+	parts = (frappe.get_request_header("traceparent") or "").split("-")
+	if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+		return parts[1], parts[2]
+	return None, None
+
+
+def _otel_available():
+	try:
+		import opentelemetry.trace
+	except ImportError:
+		return False
+	return True
@@ -0,0 +1,109 @@
+"""
+Warm-up so a fresh worker serves Ghost requests at steady-state latency.
+
+The first session, login or OTP call on a new worker otherwise pays for importing
+the Ghost API modules (and oauthlib / phonenumbers behind them), loading meta for
+the doctypes those flows write, the Ghost Settings document, the OTP Email Template
+and Account, and importing the configured SMS sender.
+
+Web workers are warmed at boot by `post_fork`, a gunicorn server hook that warms
+every site before the worker accepts its first request. Enable it in the gunicorn
+config of the web workers (`gunicorn -c <file>`):
+
+	from ghost.warmup import post_fork
+
+Frappe itself has no worker boot hook, so without that config `warm_worker`
+(before_request) falls back to warming on the worker's first request; a failed
+warm-up is retried at most once every RETRY_INTERVAL seconds. `warm_up`
+is also an after_migrate hook, so the shared Redis caches that a migrate clears
+are rebuilt before traffic comes back.
+"""
+
+import importlib
+import time
+
+import frappe
+
+WARM_DOCTYPES = ("User", "Has Role", "OAuth Bearer Token", "OTP", "Ghost Identity", "Ghost Settings")
+WARM_MODULES = ("ghost.api.auth", "ghost.api.ghost", "ghost.api.otp", "ghost.sender")
+
+# Seconds before a failed warm-up is tried again in the same worker
+RETRY_INTERVAL = 60
+
+# Sites already warmed in this worker
+_warmed = set()
+# Site -> monotonic time of its last failed warm-up in this worker
+_failed = {}
+
+
+def post_fork(server=None, worker=None):
+	"""gunicorn post_fork hook: warm every site Ghost is installed on, before serving."""
+	from frappe.utils import get_sites
+
+	for site in get_sites():
+		try:
+			frappe.init(site=site)
+			frappe.connect()
+			if "ghost" in frappe.get_installed_apps():
+				warm_worker()
+		except Exception:
+			# Left to the before_request fallback
+			frappe.logger().warning(f"Ghost warm-up at worker boot failed for {site}", exc_info=True)
+		finally:
+			frappe.destroy()
+
+
+def warm_worker(*args, **kwargs):
+	"""before_request hook (fallback when the worker was not warmed at boot)"""
+	site = getattr(frappe.local, "site", None)
+	if not site or site in _warmed:
+		return
+
+	failed_at = _failed.get(site)
+	if failed_at and time.monotonic() - failed_at < RETRY_INTERVAL:
+		return
+
+	# Only a successful warm-up counts, so a failed one is tried again after RETRY_INTERVAL
+	if warm_up():
+		_warmed.add(site)
+		_failed.pop(site, None)
+	else:
+		_failed[site] = time.monotonic()
+
+
+def warm_up():
+	"""Also the after_migrate hook. Returns whether everything was warmed."""
+	try:
+		_warm_up()
+	except Exception:
+		# A cold cache is slow, not broken: never fail a request or a migrate over it
+		frappe.logger().warning("Ghost warm-up failed", exc_info=True)
+		return False
+	return True
+
+
+def _warm_up():
+	for module in WARM_MODULES:
+		importlib.import_module(module)
+
+	for doctype in WARM_DOCTYPES:
+		frappe.get_meta(doctype)
+
+	settings = frappe.get_cached_doc("Ghost Settings")
+
+	if settings.email_template:
+		frappe.get_cached_doc("Email Template", settings.email_template)
+	if settings.email_account:
+		frappe.get_cached_doc("Email Account", settings.email_account)
+	if settings.sms_sender:
+		frappe.get_attr(settings.sms_sender)
+
+	if settings.client_id:
+		from ghost.oauth import get_client_policy
+
+		get_client_policy(settings.client_id)
+
+	# phonenumbers loads region metadata on first use
+	from ghost.phone import normalize_phone
+
+	normalize_phone("+14155550123", region=settings.default_phone_region)